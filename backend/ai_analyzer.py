@@ -3,10 +3,24 @@ AI Analyzer - Uses Gemini Pro API to analyze and improve schedules
 Provides insights, fairness evaluation, and optimization suggestions
 """
 
+import asyncio
+import concurrent.futures
+import functools
+import hashlib
 import json
 import os
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from itertools import islice
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, Final, List, Optional, Tuple
+try:
+    import numpy as np
+except ImportError:
+    np = None
+import orjson
 import google.generativeai as genai
 from dotenv import load_dotenv
 
@@ -14,51 +28,245 @@ from dotenv import load_dotenv
 backend_dir = Path(__file__).parent
 env_path = backend_dir / '.env'
 
-# Handle encoding issues (Windows may save .env as UTF-16)
+
+def _detect_env_encoding(path: Path) -> str:
+    """Pick .env encoding from its BOM (Windows may save .env as UTF-16)"""
+    with open(path, 'rb') as f:
+        head = f.read(4)
+    if head[:2] in (b'\xff\xfe', b'\xfe\xff'):
+        return 'utf-16'
+    if head[:3] == b'\xef\xbb\xbf':
+        return 'utf-8-sig'
+    return 'utf-8'
+
+
 try:
     if env_path.exists():
-        # Try common encodings first (faster than chardet)
-        loaded = False
-        for enc in ['utf-8', 'utf-16', 'utf-16-le', 'utf-16-be', 'latin-1', 'cp1252']:
-            try:
-                load_dotenv(dotenv_path=env_path, encoding=enc)
-                loaded = True
-                break
-            except (UnicodeDecodeError, UnicodeError, Exception):
-                continue
-        
-        # If chardet available, use it as fallback
-        if not loaded:
-            try:
-                import chardet
-                with open(env_path, 'rb') as f:
-                    raw_data = f.read()
-                    detected = chardet.detect(raw_data)
-                    encoding = detected.get('encoding', 'utf-8')
-                load_dotenv(dotenv_path=env_path, encoding=encoding)
-            except (ImportError, Exception):
-                # Final fallback: try UTF-8 with errors='ignore'
-                try:
-                    with open(env_path, 'r', encoding='utf-8', errors='ignore') as f:
-                        content = f.read()
-                    # Manually parse and set env vars if needed
-                    load_dotenv(dotenv_path=env_path, encoding='utf-8', override=True)
-                except Exception:
-                    print(f"Warning: Could not load .env file with any encoding. Please save .env as UTF-8.")
+        try:
+            load_dotenv(dotenv_path=env_path, encoding=_detect_env_encoding(env_path))
+        except UnicodeDecodeError:
+            load_dotenv(dotenv_path=env_path, encoding='latin-1')
     else:
         load_dotenv()
 except Exception as e:
     # If loading fails, just continue - will check for API key later
     print(f"Warning: Could not load .env file: {e}")
+
+# Extracts retry delay from rate limit errors (e.g. "retry in 30s")
+_RETRY_RE = re.compile(r'retry in ([\d.]+)s?', re.IGNORECASE)
+
+# Prompt templates - only {context} is filled in per call
+_FAIRNESS_TEMPLATE: Final[str] = """
+{context}
+
+You are analyzing the FAIRNESS of this employee schedule. Focus on OPTIMIZATION aspects:
+
+1. **Workload Distribution**: Analyze shift distribution among employees. Are some significantly overworked or underworked? Calculate the variance and identify outliers.
+
+2. **Load Balancing**: Evaluate how well the workload is balanced. Consider:
+   - The spread between minimum and maximum shifts per employee
+   - Coefficient of variation in shift distribution
+   - Whether the distribution approaches optimal fairness
+
+3. **Location Diversity**: Assess how employees are distributed across locations:
+   - How many employees work at multiple locations?
+   - Is the location distribution fair and efficient?
+   - Are there employees stuck at one location?
+
+4. **Shift Type Balance**: Analyze distribution of morning/afternoon/evening shifts:
+   - Is each employee getting a balanced mix of shift types?
+   - Are some employees getting only undesirable shifts?
+
+Provide a detailed fairness analysis with specific metrics and actionable recommendations for OPTIMIZATION.
+"""
+
+_INSIGHTS_TEMPLATE: Final[str] = """
+{context}
+
+Analyze this schedule for OPTIMIZATION OPPORTUNITIES. Focus on:
+
+**Load Balancing Issues:**
+- Identify employees with unusually high or low shift counts
+- Detect patterns in shift distribution that indicate imbalance
+- Calculate and report variance metrics
+
+**Conflict Resolution:**
+- Verify no scheduling conflicts exist
+- Check for potential issues that constraints might have missed
+- Identify edge cases that need attention
+
+**Distribution Patterns:**
+- How are employees distributed across locations?
+- Are shift types (morning/afternoon/evening) balanced?
+- Are there bottlenecks or underutilized resources?
+
+Provide KEY INSIGHTS with specific numbers, metrics, and optimization recommendations.
+"""
+
+_SUGGESTIONS_TEMPLATE: Final[str] = """
+{context}
+
+Provide SPECIFIC OPTIMIZATION SUGGESTIONS to improve this schedule. Focus on:
+
+**1. Fairness Optimization:**
+- How to better balance shifts among employees
+- Specific adjustments to reduce variance
+- Strategies to ensure minimum/maximum constraints are met optimally
+
+**2. Load Balancing Improvements:**
+- How to redistribute shifts for better balance
+- Identify which employees should work more/fewer shifts
+- Calculate target distribution and suggest changes
+
+**3. Conflict Resolution:**
+- Address any detected scheduling conflicts
+- Suggest constraint adjustments if needed
+- Propose handling for edge cases
+
+**4. Location Distribution:**
+- Optimize cross-location assignments
+- Ensure employees have appropriate location diversity
+- Balance workload across all locations
+
+**5. Shift Type Distribution:**
+- Balance morning/afternoon/evening shifts per employee
+- Ensure no employee gets only undesirable shifts
+- Optimize shift type allocation
+
+Provide actionable, specific recommendations with expected impact on fairness and load balance scores.
+"""
+
+_EXPLANATION_TEMPLATE: Final[str] = """
+{context}
+
+Explain how this schedule was generated. Describe:
+1. The overall approach to scheduling
+2. Key constraints that were considered
+3. How the system ensures adequate coverage
+4. How fairness was maintained
+
+Write this as if explaining to HR management.
+"""
+
+# Selected model name is cached on disk so list_models() isn't hit on every construction
+MODEL_CACHE_FILE = backend_dir / '.gemini_model_cache.json'
+MODEL_CACHE_TTL = 86400  # 24 hours
+
+# AI analysis results are cached on disk by schedule content hash
+AI_CACHE_DIR = backend_dir / '.ai_cache'
+AI_CACHE_TTL = 86400  # 24 hours
+AI_CACHE_MAX_ENTRIES = 50
+
+# Hash of the API key genai was last configured with
+_configured_key_hash: Optional[str] = None
+
+
+def _api_key_hash(api_key: str) -> str:
+    """Short hash identifying the API key without storing it"""
+    return hashlib.sha256(api_key.encode()).hexdigest()[:16]
+
+
+def _load_cached_model(api_key: str) -> Optional[str]:
+    """Return cached model name if it is fresh and belongs to this API key"""
     try:
-        load_dotenv()
-    except:
+        with open(MODEL_CACHE_FILE, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return None
+    
+    if cache.get('key_hash') != _api_key_hash(api_key):
+        return None
+    if time.time() - cache.get('ts', 0) >= MODEL_CACHE_TTL:
+        return None
+    return cache.get('model')
+
+
+def _save_cached_model(api_key: str, model_name: str):
+    """Persist selected model name for later AIAnalyzer instances"""
+    try:
+        with open(MODEL_CACHE_FILE, 'w', encoding='utf-8') as f:
+            json.dump({
+                'model': model_name,
+                'ts': time.time(),
+                'key_hash': _api_key_hash(api_key)
+            }, f)
+    except OSError as e:
+        print(f"Warning: Could not write model cache: {e}")
+
+
+def _invalidate_model_cache():
+    """Remove cached model name (e.g. when the model is no longer found)"""
+    try:
+        MODEL_CACHE_FILE.unlink()
+    except FileNotFoundError:
         pass
 
 
+@functools.lru_cache(maxsize=1)
+def _openai_cls():
+    """Import OpenAI client class only when the fallback provider is used"""
+    from openai import OpenAI
+    return OpenAI
+
+
+def _schedule_hash(schedule_data: Dict) -> str:
+    """Content hash of a schedule (generation timestamp excluded)"""
+    content = {k: v for k, v in schedule_data.items() if k != 'generated_at'}
+    return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _load_cached_analysis(key: str) -> Optional[Dict]:
+    """Return cached analysis for this schedule hash if it is still fresh"""
+    cache_file = AI_CACHE_DIR / f"{key}.json"
+    try:
+        if time.time() - cache_file.stat().st_mtime >= AI_CACHE_TTL:
+            cache_file.unlink(missing_ok=True)
+            return None
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_cached_analysis(key: str, analysis: Dict):
+    """Write analysis result to the on-disk cache"""
+    try:
+        AI_CACHE_DIR.mkdir(exist_ok=True)
+        with open(AI_CACHE_DIR / f"{key}.json", 'w', encoding='utf-8') as f:
+            json.dump(analysis, f, ensure_ascii=False, default=str)
+        _prune_analysis_cache()
+    except OSError as e:
+        print(f"Warning: Could not write AI analysis cache: {e}")
+
+
+def _prune_analysis_cache():
+    """Keep only the newest AI_CACHE_MAX_ENTRIES files (schedule hashes rarely repeat)"""
+    entries = []
+    for cache_file in AI_CACHE_DIR.glob('*.json'):
+        try:
+            entries.append((cache_file.stat().st_mtime, cache_file))
+        except OSError:
+            pass
+    if len(entries) <= AI_CACHE_MAX_ENTRIES:
+        return
+    entries.sort(reverse=True)
+    for _, cache_file in entries[AI_CACHE_MAX_ENTRIES:]:
+        cache_file.unlink(missing_ok=True)
+
+
 class AIAnalyzer:
-    def __init__(self):
-        """Initialize AI analyzer with Gemini Pro API"""
+    def __init__(self, aggressive: bool = True):
+        """
+        Initialize AI analyzer with Gemini Pro API
+        
+        Args:
+            aggressive: Skip AI calls when the schedule is already near-perfectly fair
+        """
+        self.aggressive = aggressive
+        # Small bounded pool so async callers don't block their event loop on AI calls
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=4, thread_name_prefix="gemini")
+        # Separate pool for the individual prompt calls so analyses running in _pool can't starve them
+        self._prompt_pool = concurrent.futures.ThreadPoolExecutor(max_workers=4, thread_name_prefix="gemini-prompt")
         api_key = os.getenv('GEMINI_API_KEY') or os.getenv('OPENAI_API_KEY')
         if not api_key:
             raise ValueError(
@@ -69,8 +277,22 @@ class AIAnalyzer:
         
         # Detect API type by key format
         if api_key.startswith('AIza'):
-            # Gemini API key
-            genai.configure(api_key=api_key)
+            # Gemini API key - genai.configure is process-wide, only redo it for a new key
+            global _configured_key_hash
+            key_hash = _api_key_hash(api_key)
+            if _configured_key_hash != key_hash:
+                genai.configure(api_key=api_key)
+                _configured_key_hash = key_hash
+            self._configured_key_hash = key_hash
+            
+            # Reuse previously selected model if cache is still valid
+            cached_model = _load_cached_model(api_key)
+            if cached_model:
+                self.model = genai.GenerativeModel(cached_model)
+                self.model_name = cached_model
+                self.ai_type = "gemini"
+                print(f"✓ Using Gemini model: {cached_model} (cached)")
+                return
             
             # First, try to list available models to see what's actually available
             try:
@@ -116,6 +338,7 @@ class AIAnalyzer:
                     self.model_name = model_name
                     self.ai_type = "gemini"
                     print(f"✓ Using Gemini model: {model_name} (from {len(available_models)} available models)")
+                    _save_cached_model(api_key, model_name)
                 else:
                     raise ValueError("No Gemini models found with generateContent support")
                     
@@ -137,140 +360,86 @@ class AIAnalyzer:
         else:
             # Fallback: try OpenAI format (for backward compatibility)
             try:
-                from openai import OpenAI
-                self.client = OpenAI(api_key=api_key)
+                self.client = _openai_cls()(api_key=api_key)
                 self.model = "gpt-4o-mini"
                 self.ai_type = "openai"
                 self.model_name = "gpt-4o-mini"
             except ImportError:
                 raise ValueError("Please use Gemini API key (starts with AIza) or install openai package")
     
-    def analyze_schedule(self, schedule_data: Dict) -> Dict:
+    def analyze_schedule(self, schedule_data: Dict, force: bool = False) -> Dict:
         """
         Analyze the schedule using AI and provide insights
         
         Args:
             schedule_data: Complete schedule data including statistics
+            force: Skip the analysis cache and always call the AI
         
         Returns:
             Dictionary with AI analysis including fairness, insights, and suggestions
         """
+        # Identical schedules get identical analysis - reuse a recent result if available
+        cache_key = _schedule_hash(schedule_data)
+        if not force:
+            cached = _load_cached_analysis(cache_key)
+            if cached:
+                print("✓ Using cached AI analysis")
+                return cached
+        
         # Extract key information for AI
         stats = schedule_data.get('statistics', {})
         schedule = schedule_data.get('schedule', [])
         
+        # Calculate fairness score (0-100)
+        fairness_score = self._calculate_fairness_score(stats)
+        
+        # Nothing for the AI to improve on a near-perfectly balanced schedule
+        variance = stats.get('optimization_summary', {}).get('fairness', {}).get('variance', 1)
+        if self.aggressive and fairness_score >= 95 and variance < 0.5:
+            print("✓ Schedule is optimally fair - skipping AI analysis")
+            return {
+                'fairness_score': fairness_score,
+                'fairness_analysis': f"Schedule is optimally fair (score {fairness_score}/100). No AI analysis required.",
+                'insights': f"Workload is evenly balanced across employees (variance {variance}). No optimization opportunities detected.",
+                'optimization_suggestions': 'No optimization needed - schedule already meets fairness targets.',
+                'schedule_explanation': 'Schedule generated using OR-Tools constraint programming with fairness optimization. AI analysis focuses on fairness and load balancing metrics.',
+                'ai_model_used': self.model_name,
+                'ai_provider': self.ai_type
+            }
+        
         # Build context for AI
         context = self._build_context(stats, schedule, schedule_data)
         
         # AI Prompts - Reduced to 2 most important ones for faster generation
         # Only analyze fairness and insights (skip suggestions and explanation to save time)
+        # Each entry: (prompt, max_output_tokens, temperature) - fairness is mostly numeric so needs less
         prompts = {
-            'fairness_analysis': self._get_fairness_prompt(context),
-            'insights': self._get_insights_prompt(context),
+            'fairness_analysis': (self._get_fairness_prompt(context), 500, 0.3),
+            'insights': (self._get_insights_prompt(context), 800, 0.5),
             # 'suggestions': self._get_suggestions_prompt(context),  # Skip for faster generation
             # 'explanation': self._get_explanation_prompt(context)   # Skip for faster generation
         }
         
-        results = {}
-        
         # System instruction
         system_instruction = "You are an expert HR scheduling analyst. Provide clear, actionable insights."
         
-        import time
-        skip_remaining = False  # Flag to skip remaining calls if rate limited
-        previous_key = None
+        # Prompts are independent - issue them concurrently instead of one after another
+        outcomes = self._run_all(prompts, system_instruction)
         
-        for key, prompt in prompts.items():
-            # If previous call was rate limited, skip all remaining calls
-            if skip_remaining:
-                print(f"⏭ Skipping {key} - previous call rate limited")
-                results[key] = "⚠ Skipped: Previous AI analysis rate limited. Please try again later."
-                continue
-            
-            # Delay between calls (but only if previous succeeded)
-            if previous_key and previous_key in results:
-                if not results[previous_key].startswith('⚠'):
-                    time.sleep(1.5)  # 1.5s delay between successful calls
-                else:
-                    # Previous call failed, skip remaining to fail fast
-                    skip_remaining = True
-                    results[key] = "⚠ Skipped: Previous AI analysis failed. Please try again later."
-                    continue
-            
-            previous_key = key
-            try:
-                # Combine system instruction with user prompt
-                full_prompt = f"{system_instruction}\n\n{prompt}"
-                
-                # Try once - if rate limit, skip immediately (no retry to avoid long waits)
-                if self.ai_type == "gemini":
-                    # Generate content with Gemini
-                    response = self.model.generate_content(
-                        full_prompt,
-                        generation_config=genai.types.GenerationConfig(
-                            temperature=0.7,
-                            max_output_tokens=1000,  # Increased from 500 to get full responses
-                        )
-                    )
-                    results[key] = response.text.strip()
-                else:
-                    # Generate content with OpenAI (fallback)
-                    response = self.client.chat.completions.create(
-                        model=self.model,
-                        messages=[
-                            {"role": "system", "content": system_instruction},
-                            {"role": "user", "content": prompt}
-                        ],
-                        temperature=0.7,
-                        max_tokens=1000
-                    )
-                    results[key] = response.choices[0].message.content.strip()
-            except Exception as e:
-                error_msg = str(e)
+        results = {}
+        for key, outcome in zip(prompts, outcomes):
+            if isinstance(outcome, Exception):
+                error_msg = str(outcome)
                 print(f"⚠ Warning: AI analysis failed for {key}")
                 print(f"   Error details: {error_msg[:200]}...")  # Log first 200 chars only
-                
-                # Parse and format error message for better UX - ALWAYS format before saving
-                formatted_msg = None
-                
-                if "429" in error_msg or "quota" in error_msg.lower() or "exceeded" in error_msg.lower():
-                    # Rate limit / quota exceeded - set flag to skip remaining calls
-                    skip_remaining = True
-                    
-                    if "retry in" in error_msg.lower():
-                        # Extract retry time if available
-                        import re
-                        retry_match = re.search(r'retry in ([\d.]+)s?', error_msg.lower())
-                        if retry_match:
-                            retry_sec = float(retry_match.group(1))
-                            if retry_sec >= 60:
-                                retry_min = int(retry_sec // 60)
-                                retry_msg = f"{retry_min} minute{'s' if retry_min > 1 else ''}"
-                            else:
-                                retry_msg = f"{int(retry_sec)} second{'s' if retry_sec > 1 else ''}"
-                        else:
-                            retry_msg = "a few minutes"
-                        formatted_msg = f"⚠ AI analysis unavailable due to API rate limit. Please try again in {retry_msg}."
-                    elif "gemini-2.0" in error_msg or "flash-exp" in error_msg:
-                        formatted_msg = "⚠ AI analysis unavailable: Experimental model quota exceeded. The system will use a stable model on next generation."
-                    else:
-                        formatted_msg = "⚠ AI analysis unavailable: API quota exceeded. Please check your Gemini API quota or wait a few minutes before trying again."
-                elif "404" in error_msg or "not found" in error_msg.lower():
-                    # Model not found
-                    formatted_msg = "⚠ AI analysis unavailable: Model not found. The system will try an alternative model on next attempt."
-                else:
-                    # Generic error - show short, user-friendly message
-                    if "error" in error_msg.lower() and len(error_msg) > 100:
-                        formatted_msg = "⚠ AI analysis temporarily unavailable. Please try again later."
-                    else:
-                        # Keep short errors as-is but truncate if too long
-                        short_msg = error_msg[:150] + "..." if len(error_msg) > 150 else error_msg
-                        formatted_msg = f"⚠ AI analysis unavailable: {short_msg}"
-                
-                results[key] = formatted_msg or "⚠ AI analysis unavailable. Please try again later."
-        
-        # Calculate fairness score (0-100)
-        fairness_score = self._calculate_fairness_score(stats)
+                results[key] = self._format_error_message(error_msg)
+                if "404" in error_msg or "not found" in error_msg.lower():
+                    # Cached model may be gone - drop it and the shared instance so the
+                    # next get_analyzer() re-runs model discovery
+                    _invalidate_model_cache()
+                    _discard_analyzer(self)
+            else:
+                results[key] = outcome
         
         # For skipped prompts, provide default messages
         insights_text = results.get('insights', '')
@@ -278,7 +447,7 @@ class AIAnalyzer:
             # If insights failed, combine with suggestions prompt for a simpler combined analysis
             pass
         
-        return {
+        analysis = {
             'fairness_score': fairness_score,
             'fairness_analysis': results.get('fairness_analysis', ''),
             'insights': insights_text or 'AI insights generation skipped for faster schedule generation.',
@@ -287,6 +456,98 @@ class AIAnalyzer:
             'ai_model_used': self.model_name,
             'ai_provider': self.ai_type
         }
+        
+        # Only cache complete results so failed calls are retried next time
+        if not any(text.startswith('⚠') for text in results.values()):
+            _save_cached_analysis(cache_key, analysis)
+        
+        return analysis
+    
+    async def analyze_schedule_async(self, schedule_data: Dict, force: bool = False) -> Dict:
+        """Async variant of analyze_schedule that runs in the analyzer's thread pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, self.analyze_schedule, schedule_data, force)
+    
+    def _run_all(
+        self,
+        prompts: Dict[str, Tuple[str, int, float]],
+        system_instruction: str
+    ) -> List:
+        """Run all prompts concurrently on the prompt pool, returning text or the raised exception per prompt"""
+        def _generate(prompt: str, max_tokens: int, temperature: float) -> str:
+            # Try once - if rate limit, fail immediately (no retry to avoid long waits)
+            if self.ai_type == "gemini":
+                # Combine system instruction with user prompt
+                full_prompt = f"{system_instruction}\n\n{prompt}"
+                response = self.model.generate_content(
+                    full_prompt,
+                    generation_config=genai.types.GenerationConfig(
+                        temperature=temperature,
+                        max_output_tokens=max_tokens,
+                    ),
+                    stream=True
+                )
+                # Consume chunks as they arrive; errors mid-stream propagate like any other failure
+                return "".join(chunk.text for chunk in response).strip()
+            else:
+                # Generate content with OpenAI (fallback)
+                response = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[
+                        {"role": "system", "content": system_instruction},
+                        {"role": "user", "content": prompt}
+                    ],
+                    temperature=temperature,
+                    max_tokens=max_tokens
+                )
+                return response.choices[0].message.content.strip()
+        
+        # Sync clients on worker threads - no per-call event loop for SDK clients to get bound to
+        futures = [self._prompt_pool.submit(_generate, *spec) for spec in prompts.values()]
+        outcomes = []
+        for future in futures:
+            try:
+                outcomes.append(future.result())
+            except Exception as e:
+                outcomes.append(e)
+        return outcomes
+    
+    def _format_error_message(self, error_msg: str) -> str:
+        """Parse and format AI error message for better UX"""
+        formatted_msg = None
+        
+        if "429" in error_msg or "quota" in error_msg.lower() or "exceeded" in error_msg.lower():
+            # Rate limit / quota exceeded
+            if "retry in" in error_msg.lower():
+                # Extract retry time if available
+                retry_match = _RETRY_RE.search(error_msg)
+                if retry_match:
+                    retry_sec = float(retry_match.group(1))
+                    if retry_sec >= 60:
+                        retry_min = int(retry_sec // 60)
+                        retry_msg = f"{retry_min} minute{'s' if retry_min > 1 else ''}"
+                    else:
+                        retry_msg = f"{int(retry_sec)} second{'s' if retry_sec > 1 else ''}"
+                else:
+                    retry_msg = "a few minutes"
+                formatted_msg = f"⚠ AI analysis unavailable due to API rate limit. Please try again in {retry_msg}."
+            elif "gemini-2.0" in error_msg or "flash-exp" in error_msg:
+                formatted_msg = "⚠ AI analysis unavailable: Experimental model quota exceeded. The system will use a stable model on next generation."
+            else:
+                formatted_msg = "⚠ AI analysis unavailable: API quota exceeded. Please check your Gemini API quota or wait a few minutes before trying again."
+        elif "404" in error_msg or "not found" in error_msg.lower():
+            # Model not found
+            formatted_msg = "⚠ AI analysis unavailable: Model not found. The system will try an alternative model on next attempt."
+        else:
+            # Generic error - show short, user-friendly message
+            if "error" in error_msg.lower() and len(error_msg) > 100:
+                formatted_msg = "⚠ AI analysis temporarily unavailable. Please try again later."
+            else:
+                # Keep short errors as-is but truncate if too long
+                short_msg = error_msg[:150] + "..." if len(error_msg) > 150 else error_msg
+                formatted_msg = f"⚠ AI analysis unavailable: {short_msg}"
+        
+        return formatted_msg or "⚠ AI analysis unavailable. Please try again later."
     
     def _build_context(self, stats: Dict, schedule: List[Dict], full_data: Dict) -> str:
         """Build context string for AI analysis with optimization metrics"""
@@ -294,15 +555,24 @@ class AIAnalyzer:
         fairness_info = opt_summary.get('fairness', {})
         load_balancing = opt_summary.get('load_balancing', {})
         location_dist = opt_summary.get('location_distribution', {})
+        shifts_per_location = stats.get('shifts_per_location', {})
+        shifts_per_type = stats.get('shifts_per_type', {})
+        shifts_per_day = stats.get('shifts_per_day', {})
+        shifts_per_employee = stats.get('shifts_per_employee', {})
+        location_diversity = stats.get('location_diversity', {})
+        num_employees = len(full_data.get('employees', ()))
+        num_locations = len(full_data.get('locations', ()))
+        num_shifts = len(full_data.get('shifts', ()))
+        num_days = len(full_data.get('dates', ()))
         
-        context = f"""
+        parts = [f"""
 SCHEDULING SYSTEM CONTEXT - OPTIMIZATION ANALYSIS:
 
 Basic Information:
-- Total Employees: {len(full_data.get('employees', []))}
-- Locations: {len(full_data.get('locations', []))}
-- Shifts per day: {len(full_data.get('shifts', []))}
-- Schedule period: {len(full_data.get('dates', []))} days (2 weeks)
+- Total Employees: {num_employees}
+- Locations: {num_locations}
+- Shifts per day: {num_shifts}
+- Schedule period: {num_days} days (2 weeks)
 - Total shift assignments: {stats.get('total_assignments', 0)}
 
 === FAIRNESS & LOAD BALANCING METRICS ===
@@ -321,24 +591,29 @@ Location Diversity:
 - Average locations per employee: {location_dist.get('avg_per_employee', 0):.2f}
 
 Location Assignment Counts:
-{self._format_distribution(stats.get('shifts_per_location', {}))}
-
+"""]
+        self._format_distribution_into(parts, shifts_per_location)
+        parts.append("""
 === SHIFT TYPE DISTRIBUTION ===
 Shift Type Counts:
-{self._format_distribution(stats.get('shifts_per_type', {}))}
-- Average shift type diversity: {stats.get('avg_shift_diversity', 0):.2f}/100
+""")
+        self._format_distribution_into(parts, shifts_per_type)
+        parts.append(f"""- Average shift type diversity: {stats.get('avg_shift_diversity', 0):.2f}/100
 
 === DAILY DISTRIBUTION ===
 Daily Assignment Counts (first 5 days):
-{self._format_distribution(dict(list(stats.get('shifts_per_day', {}).items())[:5]))}
-
+""")
+        self._format_distribution_into(parts, dict(islice(shifts_per_day.items(), 5)))
+        parts.append("""
 === DETAILED EMPLOYEE BREAKDOWN ===
-Shifts per Employee (all employees):
-{self._format_distribution(stats.get('shifts_per_employee', {}))}
-
+Shifts per Employee:
+""")
+        parts.append(self._summarize_outliers(shifts_per_employee) + "\n")
+        parts.append("""
 Location Diversity per Employee:
-{self._format_distribution(stats.get('location_diversity', {}))}
-
+""")
+        parts.append(self._summarize_outliers(location_diversity) + "\n")
+        parts.append("""
 === OPTIMIZATION TARGETS ===
 The system aims to:
 1. Maximize fairness (minimize variance in shifts per employee)
@@ -346,117 +621,55 @@ The system aims to:
 3. Ensure location diversity (employees work across multiple locations)
 4. Balance shift types (fair distribution of morning/afternoon/evening)
 5. Resolve conflicts (no overlapping or consecutive shifts)
-"""
-        return context
+""")
+        return "".join(parts)
+    
+    def _format_distribution_into(self, buf: List[str], distribution: Dict):
+        """Append formatted distribution lines to buf (one line per entry)"""
+        if not distribution:
+            buf.append("  None\n")
+        else:
+            buf.extend(f"  {key}: {value}\n" for key, value in distribution.items())
     
     def _format_distribution(self, distribution: Dict) -> str:
         """Format distribution dictionary for readability"""
-        if not distribution:
-            return "  None"
-        lines = []
-        for key, value in distribution.items():
-            lines.append(f"  {key}: {value}")
+        buf = []
+        self._format_distribution_into(buf, distribution)
+        return "".join(buf).rstrip("\n")
+    
+    def _summarize_outliers(self, distribution: Dict, k: int = 5) -> str:
+        """Summarize per-employee distribution as top/bottom k plus histogram (full dump if small)"""
+        if len(distribution) <= 20:
+            return self._format_distribution(distribution)
+        
+        ordered = sorted(distribution.items(), key=lambda item: item[1])
+        lines = [f"  Highest {k}:"]
+        lines.extend(f"    {key}: {value}" for key, value in reversed(ordered[-k:]))
+        lines.append(f"  Lowest {k}:")
+        lines.extend(f"    {key}: {value}" for key, value in ordered[:k])
+        
+        if np is not None:
+            counts, edges = np.histogram([value for _, value in ordered], bins=5)
+            lines.append("  Histogram:")
+            for count, low, high in zip(counts, edges[:-1], edges[1:]):
+                lines.append(f"    {low:.1f}-{high:.1f}: {count} employees")
         return "\n".join(lines)
     
     def _get_fairness_prompt(self, context: str) -> str:
         """Get prompt for fairness analysis focused on optimization"""
-        return f"""
-{context}
-
-You are analyzing the FAIRNESS of this employee schedule. Focus on OPTIMIZATION aspects:
-
-1. **Workload Distribution**: Analyze shift distribution among employees. Are some significantly overworked or underworked? Calculate the variance and identify outliers.
-
-2. **Load Balancing**: Evaluate how well the workload is balanced. Consider:
-   - The spread between minimum and maximum shifts per employee
-   - Coefficient of variation in shift distribution
-   - Whether the distribution approaches optimal fairness
-
-3. **Location Diversity**: Assess how employees are distributed across locations:
-   - How many employees work at multiple locations?
-   - Is the location distribution fair and efficient?
-   - Are there employees stuck at one location?
-
-4. **Shift Type Balance**: Analyze distribution of morning/afternoon/evening shifts:
-   - Is each employee getting a balanced mix of shift types?
-   - Are some employees getting only undesirable shifts?
-
-Provide a detailed fairness analysis with specific metrics and actionable recommendations for OPTIMIZATION.
-"""
+        return _FAIRNESS_TEMPLATE.format(context=context)
     
     def _get_insights_prompt(self, context: str) -> str:
         """Get prompt for optimization insights"""
-        return f"""
-{context}
-
-Analyze this schedule for OPTIMIZATION OPPORTUNITIES. Focus on:
-
-**Load Balancing Issues:**
-- Identify employees with unusually high or low shift counts
-- Detect patterns in shift distribution that indicate imbalance
-- Calculate and report variance metrics
-
-**Conflict Resolution:**
-- Verify no scheduling conflicts exist
-- Check for potential issues that constraints might have missed
-- Identify edge cases that need attention
-
-**Distribution Patterns:**
-- How are employees distributed across locations?
-- Are shift types (morning/afternoon/evening) balanced?
-- Are there bottlenecks or underutilized resources?
-
-Provide KEY INSIGHTS with specific numbers, metrics, and optimization recommendations.
-"""
+        return _INSIGHTS_TEMPLATE.format(context=context)
     
     def _get_suggestions_prompt(self, context: str) -> str:
         """Get prompt for optimization suggestions focused on fairness, load balancing, conflict resolution"""
-        return f"""
-{context}
-
-Provide SPECIFIC OPTIMIZATION SUGGESTIONS to improve this schedule. Focus on:
-
-**1. Fairness Optimization:**
-- How to better balance shifts among employees
-- Specific adjustments to reduce variance
-- Strategies to ensure minimum/maximum constraints are met optimally
-
-**2. Load Balancing Improvements:**
-- How to redistribute shifts for better balance
-- Identify which employees should work more/fewer shifts
-- Calculate target distribution and suggest changes
-
-**3. Conflict Resolution:**
-- Address any detected scheduling conflicts
-- Suggest constraint adjustments if needed
-- Propose handling for edge cases
-
-**4. Location Distribution:**
-- Optimize cross-location assignments
-- Ensure employees have appropriate location diversity
-- Balance workload across all locations
-
-**5. Shift Type Distribution:**
-- Balance morning/afternoon/evening shifts per employee
-- Ensure no employee gets only undesirable shifts
-- Optimize shift type allocation
-
-Provide actionable, specific recommendations with expected impact on fairness and load balance scores.
-"""
+        return _SUGGESTIONS_TEMPLATE.format(context=context)
     
     def _get_explanation_prompt(self, context: str) -> str:
         """Get prompt for schedule explanation"""
-        return f"""
-{context}
-
-Explain how this schedule was generated. Describe:
-1. The overall approach to scheduling
-2. Key constraints that were considered
-3. How the system ensures adequate coverage
-4. How fairness was maintained
-
-Write this as if explaining to HR management.
-"""
+        return _EXPLANATION_TEMPLATE.format(context=context)
     
     def _calculate_fairness_score(self, stats: Dict) -> float:
         """Calculate a simple fairness score based on distribution"""
@@ -465,20 +678,42 @@ Write this as if explaining to HR management.
         if not shifts_per_employee:
             return 0.0
         
-        values = [int(v) for v in shifts_per_employee.values()]
-        if not values:
-            return 0.0
-        
-        min_val = min(values)
-        max_val = max(values)
-        avg_val = sum(values) / len(values)
+        if np is not None:
+            arr = np.fromiter(
+                (int(v) for v in shifts_per_employee.values()),
+                dtype=np.int64,
+                count=len(shifts_per_employee)
+            )
+            if arr.size == 0:
+                return 0.0
+            
+            min_val = int(arr.min())
+            max_val = int(arr.max())
+            avg_val = float(arr.mean())
+            std_dev = float(arr.std())
+        else:
+            # Welford's one-pass mean/variance (plus min/max) without NumPy
+            n = 0
+            avg_val = 0.0
+            m2 = 0.0
+            min_val = float('inf')
+            max_val = float('-inf')
+            for v in shifts_per_employee.values():
+                x = int(v)
+                n += 1
+                delta = x - avg_val
+                avg_val += delta / n
+                m2 += delta * (x - avg_val)
+                min_val = x if x < min_val else min_val
+                max_val = x if x > max_val else max_val
+            if n == 0:
+                return 0.0
+            std_dev = (m2 / n) ** 0.5
         
         # Calculate coefficient of variation (lower is better)
         if avg_val == 0:
             return 0.0
         
-        variance = sum((x - avg_val) ** 2 for x in values) / len(values)
-        std_dev = variance ** 0.5
         coefficient_of_variation = std_dev / avg_val if avg_val > 0 else 1.0
         
         # Convert to score (0-100, lower CV = higher score)
@@ -504,8 +739,7 @@ Write this as if explaining to HR management.
             AI analysis results
         """
         try:
-            with open(schedule_file, 'r', encoding='utf-8') as f:
-                schedule_data = json.load(f)
+            schedule_data = orjson.loads(Path(schedule_file).read_bytes())
             
             print("\n" + "=" * 60)
             print("AI Analysis - Analyzing Schedule")
@@ -515,12 +749,11 @@ Write this as if explaining to HR management.
             
             # Save analysis
             output_file = schedule_file.replace('.json', '_ai_analysis.json')
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump({
-                    'schedule_file': schedule_file,
-                    'analysis': analysis,
-                    'analyzed_at': json.dumps(dict(), default=str)  # Will be set properly
-                }, f, ensure_ascii=False, indent=2, default=str)
+            Path(output_file).write_bytes(orjson.dumps({
+                'schedule_file': schedule_file,
+                'analysis': analysis,
+                'analyzed_at': datetime.now(timezone.utc).isoformat()
+            }, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY, default=str))
             
             print(f"\n✓ AI Analysis completed!")
             print(f"✓ Fairness Score: {analysis['fairness_score']}/100")
@@ -535,6 +768,29 @@ Write this as if explaining to HR management.
             return None
 
 
+_SINGLETON: Optional[AIAnalyzer] = None
+_SINGLETON_LOCK = threading.Lock()
+
+
+def get_analyzer() -> AIAnalyzer:
+    """Return a process-wide AIAnalyzer, creating it on first use"""
+    global _SINGLETON
+    if _SINGLETON is None:
+        # Server handles requests on several threads - construct only once
+        with _SINGLETON_LOCK:
+            if _SINGLETON is None:
+                _SINGLETON = AIAnalyzer()
+    return _SINGLETON
+
+
+def _discard_analyzer(analyzer: AIAnalyzer):
+    """Drop the shared analyzer (if it is this one) so the next get_analyzer() builds a new one"""
+    global _SINGLETON
+    with _SINGLETON_LOCK:
+        if _SINGLETON is analyzer:
+            _SINGLETON = None
+
+
 def main():
     """Main function for AI analysis"""
     import sys
@@ -545,7 +801,7 @@ def main():
         base_dir = os.path.dirname(os.path.abspath(__file__))
         schedule_file = os.path.join(base_dir, 'data', 'schedule.json')
     
-    analyzer = AIAnalyzer()
+    analyzer = get_analyzer()
     analyzer.analyze_with_ai(schedule_file)
 
 
@@ -3,40 +3,197 @@ AI Pre-Analyzer - Analyzes requirements before scheduling
 Helps generate better constraints and parameters for OR-Tools
 """
 
+import hashlib
 import json
 import os
+import threading
+from collections import Counter
+from itertools import chain
 from pathlib import Path
-from typing import Dict, List, Optional
-import google.generativeai as genai
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple
+import orjson
 from dotenv import load_dotenv
 
-# Load .env file
+if TYPE_CHECKING:
+    import google.generativeai as genai
+
 backend_dir = Path(__file__).parent
 env_path = backend_dir / '.env'
+_env_loaded = False
 
-try:
-    if env_path.exists():
-        for enc in ['utf-8', 'utf-16', 'utf-16-le', 'latin-1']:
-            try:
-                load_dotenv(dotenv_path=env_path, encoding=enc)
-                break
-            except:
-                continue
-    else:
+
+def _load_env():
+    """Load .env on first AIPreAnalyzer construction (skipped if key already in environment)"""
+    global _env_loaded
+    if _env_loaded:
+        return
+    _env_loaded = True
+    if os.getenv('GEMINI_API_KEY') is not None:
+        return
+    if not env_path.exists():
         load_dotenv()
-except:
-    load_dotenv()
+        return
+    # .env is UTF-8; honor a UTF-16 BOM since Windows editors may save it that way
+    with open(env_path, 'rb') as f:
+        encoding = 'utf-16' if f.read(2) in (b'\xff\xfe', b'\xfe\xff') else 'utf-8-sig'
+    load_dotenv(dotenv_path=env_path, encoding=encoding)
+
+# google.generativeai pulls in gRPC/protobuf (~300ms); imported on first use
+_genai = None
+
+
+def _get_genai():
+    """Import google.generativeai on first call and cache the module"""
+    global _genai
+    if _genai is None:
+        import google.generativeai as genai
+        _genai = genai
+    return _genai
+
+# Resolved (model_name, GenerativeModel) per API key hash, shared across instances
+_MODEL_CACHE: Dict[str, Tuple[str, "genai.GenerativeModel"]] = {}
+
+# Hash of the API key genai was last configured with
+_configured_key_hash: Optional[str] = None
+
+# Response schema for Gemini JSON mode (mirrors the format requested in the prompt)
+RECOMMENDATIONS_SCHEMA = {
+    'type': 'OBJECT',
+    'properties': {
+        'analysis': {'type': 'STRING'},
+        'constraints': {
+            'type': 'OBJECT',
+            'properties': {
+                'min_employees_per_shift': {'type': 'INTEGER'},
+                'max_shifts_per_week': {'type': 'INTEGER'},
+                'min_shifts_per_week': {'type': 'INTEGER'},
+                'preferred_coverage_ratio': {'type': 'NUMBER'}
+            }
+        },
+        'warnings': {'type': 'ARRAY', 'items': {'type': 'STRING'}},
+        'targets': {
+            'type': 'OBJECT',
+            'properties': {
+                'fairness_target': {'type': 'INTEGER'},
+                'load_balance_target': {'type': 'INTEGER'},
+                'variance_target': {'type': 'NUMBER'}
+            }
+        }
+    },
+    'required': ['analysis', 'constraints', 'warnings', 'targets']
+}
+
+# Built requirement contexts keyed by input hash
+_CONTEXT_CACHE: Dict[str, str] = {}
+CONTEXT_CACHE_MAX_ENTRIES = 32
+
+# Streamed text length between on_partial callbacks
+PARTIAL_REPORT_CHARS = 400
+
+# Output budget for the JSON recommendations (prompt asks for a short analysis field)
+MAX_OUTPUT_TOKENS = 2048
+
+# Accepted (type, min, max) per numeric field - model output outside these is clamped
+CONSTRAINT_LIMITS = {
+    'min_employees_per_shift': (int, 1, 50),
+    'max_shifts_per_week': (int, 1, 21),
+    'min_shifts_per_week': (int, 0, 21),
+    'preferred_coverage_ratio': (float, 0.0, 1.0)
+}
+TARGET_LIMITS = {
+    'fairness_target': (int, 0, 100),
+    'load_balance_target': (int, 0, 100),
+    'variance_target': (float, 0.0, 100.0)
+}
+
+
+def _coerce_fields(raw, defaults: Dict, limits: Dict) -> Dict:
+    """Merge numeric model output onto defaults: coerce type, clamp to limits, drop invalid values"""
+    result = dict(defaults)
+    if not isinstance(raw, dict):
+        return result
+    for key, (kind, low, high) in limits.items():
+        value = raw.get(key)
+        # bool is an int subclass - never a meaningful count or ratio here
+        if value is None or isinstance(value, bool):
+            continue
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            continue
+        if number != number or number in (float('inf'), float('-inf')):
+            continue
+        number = min(max(number, low), high)
+        result[key] = int(round(number)) if kind is int else number
+    return result
+
+
+def _finish_reason(response) -> str:
+    """Name of the first candidate's finish reason ('' if unavailable)"""
+    try:
+        reason = response.candidates[0].finish_reason
+    except (AttributeError, IndexError):
+        return ''
+    return getattr(reason, 'name', str(reason))
+
+# Pre-analysis responses keyed by hash of the scheduling inputs
+RESPONSE_CACHE_FILE = backend_dir / 'data' / '.ai_cache.json'
+RESPONSE_CACHE_MAX_ENTRIES = 50
+
+
+def _requirements_hash(
+    employees: List[Dict],
+    locations: List[Dict],
+    shifts: List[Dict],
+    historical_data: Optional[Dict]
+) -> str:
+    """Canonical hash of pre-analysis inputs"""
+    canonical = json.dumps([employees, locations, shifts, historical_data], sort_keys=True, default=str)
+    return hashlib.blake2b(canonical.encode(), digest_size=16).hexdigest()
+
+
+def _load_response_cache() -> Dict:
+    """Load cached pre-analysis responses (empty if missing or unreadable)"""
+    try:
+        with open(RESPONSE_CACHE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_response_cache(cache: Dict):
+    """Persist response cache, keeping only the most recent entries"""
+    entries = list(cache.items())[-RESPONSE_CACHE_MAX_ENTRIES:]
+    try:
+        with open(RESPONSE_CACHE_FILE, 'w', encoding='utf-8') as f:
+            json.dump(dict(entries), f, ensure_ascii=False)
+    except OSError as e:
+        print(f"Warning: Could not write AI pre-analysis cache: {e}")
 
 
 class AIPreAnalyzer:
     def __init__(self):
         """Initialize AI pre-analyzer with Gemini Pro"""
+        _load_env()
         api_key = os.getenv('GEMINI_API_KEY') or os.getenv('OPENAI_API_KEY')
         if not api_key:
             raise ValueError("GEMINI_API_KEY not found in environment variables")
         
         if api_key.startswith('AIza'):
-            genai.configure(api_key=api_key)
+            global _configured_key_hash
+            genai = _get_genai()
+            key_hash = hashlib.sha256(api_key.encode()).hexdigest()[:16]
+            self._key_hash = key_hash
+            if _configured_key_hash != key_hash:
+                genai.configure(api_key=api_key)
+                _configured_key_hash = key_hash
+            
+            # Reuse model resolved by an earlier instance (skips list_models round-trip)
+            if key_hash in _MODEL_CACHE:
+                self.model_name, self.model = _MODEL_CACHE[key_hash]
+                self.ai_type = "gemini"
+                print(f"✓ Using Gemini model: {self.model_name} (cached)")
+                return
             
             # First, try to list available models
             try:
@@ -71,7 +228,9 @@ class AIPreAnalyzer:
                         model_name = stable_models[0]
                     
                     self.model = genai.GenerativeModel(model_name)
+                    self.model_name = model_name
                     self.ai_type = "gemini"
+                    _MODEL_CACHE[key_hash] = (model_name, self.model)
                     print(f"✓ Using Gemini model: {model_name}")
                 else:
                     raise ValueError("No Gemini models found with generateContent support")
@@ -81,6 +240,7 @@ class AIPreAnalyzer:
                 print(f"Warning: Could not list available models: {e}")
                 try:
                     self.model = genai.GenerativeModel('gemini-pro')
+                    self.model_name = 'gemini-pro'
                     self.ai_type = "gemini"
                     print("✓ Using Gemini model: gemini-pro")
                 except Exception as direct_error:
@@ -93,18 +253,101 @@ class AIPreAnalyzer:
         employees: List[Dict], 
         locations: List[Dict], 
         shifts: List[Dict],
-        historical_data: Optional[Dict] = None
+        historical_data: Optional[Dict] = None,
+        on_partial: Optional[Callable[[str], None]] = None
     ) -> Dict:
         """
         AI phân tích yêu cầu trước khi tạo lịch
         Đề xuất constraints và parameters tối ưu
         
+        Args:
+            on_partial: Optional callback receiving the partial response text
+                while it is still streaming
+        
         Returns:
             Dict with AI recommendations for scheduling
         """
-        context = self._build_requirements_context(employees, locations, shifts, historical_data)
+        # Inputs rarely change between runs - reuse previous recommendations for identical inputs
+        cache_key = _requirements_hash(employees, locations, shifts, historical_data)
+        cache = _load_response_cache()
+        if cache_key in cache:
+            print("✓ Using cached AI pre-analysis")
+            return cache[cache_key]
         
-        prompt = f"""
+        prompt = self.build_prompt(employees, locations, shifts, historical_data, cache_key)
+        
+        try:
+            generation_config = {'temperature': 0.7, 'max_output_tokens': MAX_OUTPUT_TOKENS}
+            if self.model_name.startswith('gemini-1.5'):
+                # Native JSON mode; older models rely on the format instructions in the prompt
+                generation_config['response_mime_type'] = 'application/json'
+                generation_config['response_schema'] = RECOMMENDATIONS_SCHEMA
+            
+            response = self.model.generate_content(
+                prompt,
+                generation_config=_get_genai().types.GenerationConfig(**generation_config),
+                stream=True
+            )
+            
+            # Accumulate chunks as they arrive, reporting progress every few hundred chars
+            chunks = []
+            received = 0
+            next_report = PARTIAL_REPORT_CHARS
+            for chunk in response:
+                chunks.append(chunk.text)
+                received += len(chunk.text)
+                if on_partial and received >= next_report:
+                    on_partial("".join(chunks))
+                    next_report = received + PARTIAL_REPORT_CHARS
+            
+            ai_recommendations = "".join(chunks).strip()
+            
+            try:
+                recommendations = self.parse_response(ai_recommendations, employees, locations, shifts)
+            except ValueError:
+                # Keep the text the model did produce; only the structured fields fall back
+                if _finish_reason(response) == 'MAX_TOKENS':
+                    reason = "AI response was cut off at the output token limit"
+                else:
+                    reason = "AI response was not valid JSON"
+                print(f"Warning: {reason} - using default constraints")
+                return {
+                    'ai_analysis': ai_recommendations,
+                    'suggested_constraints': self._default_constraints(employees, locations),
+                    'warnings': [f"{reason}; default constraints used"],
+                    'optimization_targets': self._default_targets()
+                }
+            
+            cache[cache_key] = recommendations
+            _save_response_cache(cache)
+            
+            return recommendations
+            
+        except Exception as e:
+            print(f"Warning: AI pre-analysis failed: {e}")
+            error_msg = str(e)
+            if "404" in error_msg or "not found" in error_msg.lower():
+                # Model is gone - forget it so the next analyzer re-runs model discovery
+                _discard_pre_analyzer(self)
+            return {
+                'ai_analysis': f"Analysis unavailable: {str(e)}",
+                'suggested_constraints': self._default_constraints(employees, locations),
+                'warnings': [],
+                'optimization_targets': {}
+            }
+    
+    def build_prompt(
+        self,
+        employees: List[Dict],
+        locations: List[Dict],
+        shifts: List[Dict],
+        historical_data: Optional[Dict] = None,
+        cache_key: Optional[str] = None
+    ) -> str:
+        """Build the pre-analysis prompt (usable by callers that dispatch requests themselves)"""
+        context = self._build_requirements_context(employees, locations, shifts, historical_data, cache_key)
+        
+        return f"""
 {context}
 
 You are an expert HR scheduling consultant. Before creating a schedule, analyze these requirements and provide recommendations:
@@ -130,64 +373,85 @@ You are an expert HR scheduling consultant. Before creating a schedule, analyze
    - Recommendations for location diversity?
 
 Provide specific, actionable recommendations with numbers and targets.
+
+Respond with a single JSON object only (no markdown), in this format:
+{{
+  "analysis": "<concise recommendations, at most 150 words>",
+  "constraints": {{
+    "min_employees_per_shift": <int>,
+    "max_shifts_per_week": <int>,
+    "min_shifts_per_week": <int>,
+    "preferred_coverage_ratio": <number 0-1>
+  }},
+  "warnings": ["<short warning>", ...],
+  "targets": {{
+    "fairness_target": <int 0-100>,
+    "load_balance_target": <int 0-100>,
+    "variance_target": <number>
+  }}
+}}
 """
+    
+    def parse_response(self, ai_text: str, employees: List[Dict], locations: List[Dict], shifts: List[Dict]) -> Dict:
+        """Parse structured JSON response into recommendations (defaults fill missing fields)"""
+        # Tolerate a markdown fence around the JSON from models without native JSON mode
+        text = ai_text.strip()
+        if text.startswith('```'):
+            text = text.strip('`').removeprefix('json').strip()
+        data = orjson.loads(text)
+        if not isinstance(data, dict):
+            raise ValueError("Expected a JSON object")
         
-        try:
-            response = self.model.generate_content(
-                prompt,
-                generation_config=genai.types.GenerationConfig(
-                    temperature=0.7,
-                    max_output_tokens=800,
-                )
-            )
-            
-            ai_recommendations = response.text.strip()
-            
-            # Parse recommendations into structured format
-            recommendations = {
-                'ai_analysis': ai_recommendations,
-                'suggested_constraints': self._extract_constraints(ai_recommendations, employees, locations, shifts),
-                'warnings': self._extract_warnings(ai_recommendations),
-                'optimization_targets': self._extract_targets(ai_recommendations)
-            }
-            
-            return recommendations
-            
-        except Exception as e:
-            print(f"Warning: AI pre-analysis failed: {e}")
-            return {
-                'ai_analysis': f"Analysis unavailable: {str(e)}",
-                'suggested_constraints': self._default_constraints(employees, locations),
-                'warnings': [],
-                'optimization_targets': {}
-            }
+        # Model output feeds the solver directly - never trust its types or ranges
+        constraints = _coerce_fields(
+            data.get('constraints'), self._default_constraints(employees, locations), CONSTRAINT_LIMITS
+        )
+        # The scheduler applies this minimum at every location, so above the smallest capacity is infeasible
+        min_capacity = min((loc.get('capacity', 20) for loc in locations), default=20)
+        constraints['min_employees_per_shift'] = min(
+            constraints['min_employees_per_shift'], min_capacity, self._staffing_limit(employees, locations, shifts)
+        )
+        if constraints['min_shifts_per_week'] > constraints['max_shifts_per_week']:
+            defaults = self._default_constraints(employees, locations)
+            constraints['min_shifts_per_week'] = defaults['min_shifts_per_week']
+            constraints['max_shifts_per_week'] = defaults['max_shifts_per_week']
+        targets = _coerce_fields(data.get('targets'), self._default_targets(), TARGET_LIMITS)
+        
+        warnings = data.get('warnings')
+        return {
+            'ai_analysis': str(data.get('analysis') or ''),
+            'suggested_constraints': constraints,
+            'warnings': [str(w) for w in warnings] if isinstance(warnings, list) else [],
+            'optimization_targets': targets
+        }
     
     def _build_requirements_context(
         self, 
         employees: List[Dict], 
         locations: List[Dict], 
         shifts: List[Dict],
-        historical_data: Optional[Dict]
+        historical_data: Optional[Dict],
+        cache_key: Optional[str] = None
     ) -> str:
-        """Build context for AI analysis"""
+        """Build context for AI analysis (memoized by input hash)"""
+        if cache_key is None:
+            cache_key = _requirements_hash(employees, locations, shifts, historical_data)
+        if cache_key in _CONTEXT_CACHE:
+            return _CONTEXT_CACHE[cache_key]
         
         # Count employees by skills
-        skill_distribution = {}
-        for emp in employees:
-            for skill in emp.get('skills', []):
-                skill_distribution[skill] = skill_distribution.get(skill, 0) + 1
+        skill_distribution = Counter(chain.from_iterable(emp.get('skills', []) for emp in employees))
         
         # Analyze location requirements
-        location_requirements = {}
-        for loc in locations:
-            required = loc.get('required_skills', [])
-            capacity = loc.get('capacity', 20)
-            location_requirements[loc['name']] = {
-                'required_skills': required,
-                'capacity': capacity
+        location_requirements = {
+            loc['name']: {
+                'required_skills': loc.get('required_skills', []),
+                'capacity': loc.get('capacity', 20)
             }
+            for loc in locations
+        }
         
-        context = f"""
+        parts = [f"""
 SCHEDULING REQUIREMENTS ANALYSIS:
 
 Basic Setup:
@@ -200,94 +464,76 @@ Employee Skills Distribution:
 {json.dumps(skill_distribution, indent=2)}
 
 Location Requirements:
-"""
+"""]
         for loc_name, req in location_requirements.items():
-            context += f"\n- {loc_name}:"
-            context += f"\n  Capacity: {req['capacity']}"
-            context += f"\n  Required Skills: {', '.join(req['required_skills'])}"
+            parts.append(f"\n- {loc_name}:")
+            parts.append(f"\n  Capacity: {req['capacity']}")
+            parts.append(f"\n  Required Skills: {', '.join(req['required_skills'])}")
         
-        context += f"\n\nShifts:\n"
+        parts.append("\n\nShifts:\n")
         for shift in shifts:
-            context += f"- {shift['name']}: {shift['start_time']} - {shift['end_time']}\n"
+            parts.append(f"- {shift['name']}: {shift['start_time']} - {shift['end_time']}\n")
         
         if historical_data:
-            context += f"\nHistorical Data:\n"
-            context += f"- Previous fairness score: {historical_data.get('fairness_score', 'N/A')}\n"
-            context += f"- Common issues: {historical_data.get('common_issues', 'None')}\n"
+            parts.append("\nHistorical Data:\n")
+            parts.append(f"- Previous fairness score: {historical_data.get('fairness_score', 'N/A')}\n")
+            parts.append(f"- Common issues: {historical_data.get('common_issues', 'None')}\n")
         
+        context = "".join(parts)
+        
+        # Bounded memo - drop the oldest entry once full
+        if len(_CONTEXT_CACHE) >= CONTEXT_CACHE_MAX_ENTRIES:
+            _CONTEXT_CACHE.pop(next(iter(_CONTEXT_CACHE)))
+        _CONTEXT_CACHE[cache_key] = context
         return context
     
-    def _extract_constraints(self, ai_text: str, employees: List, locations: List) -> Dict:
-        """Extract constraint recommendations from AI text"""
-        # Default constraints
-        constraints = {
+    def _staffing_limit(self, employees: List[Dict], locations: List[Dict], shifts: List[Dict]) -> int:
+        """Largest per-shift minimum the workforce can cover within the default weekly shift cap"""
+        required_sets = [frozenset(loc.get('required_skills', [])) for loc in locations]
+        qualified = sum(
+            1 for emp in employees
+            if any(not required.isdisjoint(emp.get('skills', [])) for required in required_sets)
+        )
+        slots_per_week = 7 * max(len(locations), 1) * max(len(shifts), 1)
+        weekly_cap = self._default_constraints(employees, locations)['max_shifts_per_week']
+        return max(1, qualified * weekly_cap // slots_per_week)
+    
+    def _default_constraints(self, employees: List, locations: List) -> Dict:
+        """Default constraints if AI fails"""
+        return {
             'min_employees_per_shift': 2,
             'max_shifts_per_week': 10,
             'min_shifts_per_week': 5,
             'preferred_coverage_ratio': 0.8
         }
-        
-        # Try to extract numbers from AI text
-        import re
-        
-        # Look for min employees
-        min_match = re.search(r'minimum.*?(\d+).*?employees?', ai_text.lower())
-        if min_match:
-            try:
-                constraints['min_employees_per_shift'] = int(min_match.group(1))
-            except:
-                pass
-        
-        # Look for max shifts
-        max_match = re.search(r'max.*?(\d+).*?shifts?', ai_text.lower())
-        if max_match:
-            try:
-                constraints['max_shifts_per_week'] = int(max_match.group(1))
-            except:
-                pass
-        
-        return constraints
     
-    def _extract_warnings(self, ai_text: str) -> List[str]:
-        """Extract warnings from AI analysis"""
-        warnings = []
-        
-        if 'insufficient' in ai_text.lower() or 'not enough' in ai_text.lower():
-            warnings.append("Potential coverage issues detected")
-        
-        if 'conflict' in ai_text.lower() or 'mismatch' in ai_text.lower():
-            warnings.append("Possible conflicts or mismatches identified")
-        
-        if 'capacity' in ai_text.lower() and 'exceed' in ai_text.lower():
-            warnings.append("Capacity constraints may be tight")
-        
-        return warnings
-    
-    def _extract_targets(self, ai_text: str) -> Dict:
-        """Extract optimization targets from AI analysis"""
-        targets = {
+    def _default_targets(self) -> Dict:
+        """Default optimization targets if AI omits them"""
+        return {
             'fairness_target': 80,
             'load_balance_target': 75,
             'variance_target': 3.0
         }
-        
-        import re
-        
-        # Look for fairness target
-        fairness_match = re.search(r'fairness.*?(\d+)', ai_text.lower())
-        if fairness_match:
-            try:
-                targets['fairness_target'] = int(fairness_match.group(1))
-            except:
-                pass
-        
-        return targets
-    
-    def _default_constraints(self, employees: List, locations: List) -> Dict:
-        """Default constraints if AI fails"""
-        return {
-            'min_employees_per_shift': 2,
-            'max_shifts_per_week': 10,
-            'min_shifts_per_week': 5,
-            'preferred_coverage_ratio': 0.8
-        }
+
+
+_SINGLETON: Optional[AIPreAnalyzer] = None
+_SINGLETON_LOCK = threading.Lock()
+
+
+def get_pre_analyzer() -> AIPreAnalyzer:
+    """Return a process-wide AIPreAnalyzer, creating it on first use"""
+    global _SINGLETON
+    if _SINGLETON is None:
+        with _SINGLETON_LOCK:
+            if _SINGLETON is None:
+                _SINGLETON = AIPreAnalyzer()
+    return _SINGLETON
+
+
+def _discard_pre_analyzer(analyzer: AIPreAnalyzer):
+    """Evict the analyzer's resolved model and shared instance so the next one rediscovers models"""
+    global _SINGLETON
+    with _SINGLETON_LOCK:
+        _MODEL_CACHE.pop(getattr(analyzer, '_key_hash', None), None)
+        if _SINGLETON is analyzer:
+            _SINGLETON = None
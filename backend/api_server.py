@@ -6,14 +6,22 @@ from flask import Flask, request, jsonify, send_from_directory
 from flask_cors import CORS
 import os
 import sys
-import json
+import gzip
+import hashlib
+import shutil
+import threading
+import time
+import uuid
+import concurrent.futures
+from typing import Dict
+import orjson
 
 # Add current directory to path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from scheduler import ShiftScheduler
-from ai_analyzer import AIAnalyzer
-from ai_pre_analyzer import AIPreAnalyzer
+from ai_analyzer import get_analyzer
+from ai_pre_analyzer import get_pre_analyzer
 
 app = Flask(__name__)
 CORS(app)
@@ -21,61 +29,146 @@ CORS(app)
 base_dir = os.path.dirname(os.path.abspath(__file__))
 data_dir = os.path.join(base_dir, 'data')
 
-@app.route('/api/generate', methods=['POST'])
-def generate_schedule():
-    """Generate schedule with optional data updates"""
+frontend_public = os.path.join(base_dir, '..', 'frontend', 'public')
+os.makedirs(frontend_public, exist_ok=True)
+
+# Worker threads for AI calls so they overlap with file I/O
+executor = concurrent.futures.ThreadPoolExecutor(max_workers=4)
+AI_TIMEOUT = 120  # seconds
+JOB_TTL = 3600  # seconds a finished job is kept if never polled
+
+# Background generation jobs (see /api/generate/async)
+job_executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+jobs: Dict[str, Dict] = {}
+jobs_lock = threading.Lock()
+generation_lock = threading.Lock()
+
+# blake2b of the last payload written per data file, to skip unchanged saves
+_file_hash_cache: Dict[str, bytes] = {}
+_file_hash_lock = threading.Lock()
+
+
+def _read_json(filepath: str):
+    """Load JSON data file"""
+    with open(filepath, 'rb') as f:
+        return orjson.loads(f.read())
+
+
+def _write_atomic(filepath: str, payload: bytes):
+    """Write via a temp file + os.replace so readers never see a partial file"""
+    tmp_path = filepath + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(payload)
+    os.replace(tmp_path, filepath)
+
+
+def _save_data_file(filename: str, data) -> bool:
+    """Save a data file and publish it to the frontend; returns False if content was unchanged"""
+    filepath = os.path.join(data_dir, filename)
+    # Pretty-printed for hand editing
+    payload = orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    digest = hashlib.blake2b(payload, digest_size=16).digest()
+    
+    with _file_hash_lock:
+        if _file_hash_cache.get(filename) == digest and os.path.exists(filepath):
+            return False
+        _write_atomic(filepath, payload)
+        # os.replace creates a new inode, so the frontend link must be refreshed
+        _publish_to_frontend(filename)
+        _file_hash_cache[filename] = digest
+    return True
+
+
+def _write_compact_json(filepath: str, data):
+    """Save large result JSON without indentation, plus a fast gzip copy for serving"""
+    payload = orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS, default=str)
+    with open(filepath, 'wb') as f:
+        f.write(payload)
+    # Level 1 is several times faster than the default for most of the size reduction
+    with gzip.open(filepath + '.gz', 'wb', compresslevel=1) as f:
+        f.write(payload)
+
+
+def _publish_to_frontend(filename: str):
+    """Expose a data file in frontend/public via hardlink (no data copy)"""
+    src = os.path.join(data_dir, filename)
+    dst = os.path.join(frontend_public, filename)
+    if os.path.exists(dst):
+        # Still linked to the current file (atomic rewrites replace the inode)
+        if os.path.samefile(src, dst):
+            return
+        os.remove(dst)
     try:
-        # Get data from request (optional - if not provided, use files)
-        try:
-            request_data = request.get_json() or {}
-        except Exception as e:
-            # Handle empty or invalid JSON body gracefully
-            request_data = {}
-        
+        os.link(src, dst)
+    except OSError:
+        # Hardlinks unsupported (e.g. different filesystem) - fall back to copying
+        shutil.copy2(src, dst)
+
+
+def _run_job(job_id: str, request_data: Dict):
+    """Execute a background generation job and record its outcome"""
+    try:
+        statistics = _run_generation(request_data)
+        outcome = {'status': 'done', 'success': True, 'statistics': statistics}
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        outcome = {'status': 'failed', 'success': False, 'error': str(e)}
+    outcome['finished_at'] = time.monotonic()
+    with jobs_lock:
+        jobs[job_id] = outcome
+
+
+def _expire_jobs():
+    """Drop finished jobs nobody polled within JOB_TTL (caller holds jobs_lock)"""
+    cutoff = time.monotonic() - JOB_TTL
+    for job_id in [k for k, job in jobs.items() if job.get('finished_at', cutoff) < cutoff]:
+        del jobs[job_id]
+
+
+def _run_generation(request_data: Dict) -> Dict:
+    """Run the full generation pipeline and return schedule statistics"""
+    # Generation writes shared data files - run one at a time
+    with generation_lock:
         employees_data = request_data.get('employees')
         locations_data = request_data.get('locations')
         shifts_data = request_data.get('shifts')
         
-        # Save updated data if provided
+        employees_file = os.path.join(data_dir, 'employees.json')
+        locations_file = os.path.join(data_dir, 'locations.json')
+        shifts_file = os.path.join(data_dir, 'shifts.json')
+        schedule_file = os.path.join(data_dir, 'schedule.json')
+        
+        # Save updated data if provided, otherwise read each file once
         if employees_data:
-            with open(os.path.join(data_dir, 'employees.json'), 'w', encoding='utf-8') as f:
-                json.dump(employees_data, f, ensure_ascii=False, indent=2)
+            _save_data_file('employees.json', employees_data)
+        else:
+            employees_data = _read_json(employees_file)
         
         if locations_data:
-            with open(os.path.join(data_dir, 'locations.json'), 'w', encoding='utf-8') as f:
-                json.dump(locations_data, f, ensure_ascii=False, indent=2)
+            _save_data_file('locations.json', locations_data)
+        else:
+            locations_data = _read_json(locations_file)
         
         if shifts_data:
-            with open(os.path.join(data_dir, 'shifts.json'), 'w', encoding='utf-8') as f:
-                json.dump(shifts_data, f, ensure_ascii=False, indent=2)
-        
-        # Load data files
-        employees_file = os.path.join(data_dir, 'employees.json')
-        locations_file = os.path.join(data_dir, 'locations.json')
-        shifts_file = os.path.join(data_dir, 'shifts.json')
-        schedule_file = os.path.join(data_dir, 'schedule.json')
+            _save_data_file('shifts.json', shifts_data)
+        else:
+            shifts_data = _read_json(shifts_file)
         
         # Step 0: AI Pre-Analysis (OPTIONAL - Skip to speed up)
         # Skip pre-analysis for faster generation - it's optional optimization
         ai_pre_analysis = None
         # Uncomment below to enable AI Pre-Analysis (slower but better optimization)
         # try:
-        #     pre_analyzer = AIPreAnalyzer()
-        #     with open(employees_file, 'r', encoding='utf-8') as f:
-        #         emp_data = json.load(f)
-        #     with open(locations_file, 'r', encoding='utf-8') as f:
-        #         loc_data = json.load(f)
-        #     with open(shifts_file, 'r', encoding='utf-8') as f:
-        #         shift_data = json.load(f)
-        #     
+        #     pre_analyzer = get_pre_analyzer()
         #     ai_pre_analysis = pre_analyzer.analyze_scheduling_requirements(
-        #         emp_data, loc_data, shift_data
+        #         employees_data, locations_data, shifts_data
         #     )
         # except Exception as e:
         #     print(f"AI Pre-Analysis skipped: {e}")
         
         # Step 1: Generate Schedule
-        scheduler = ShiftScheduler(employees_file, locations_file, shifts_file)
+        scheduler = ShiftScheduler(employees_data, locations_data, shifts_data)
         
         if ai_pre_analysis and ai_pre_analysis.get('suggested_constraints'):
             constraints = ai_pre_analysis['suggested_constraints']
@@ -83,13 +176,15 @@ def generate_schedule():
                 scheduler.min_employees_per_shift = constraints['min_employees_per_shift']
         
         schedule_result = scheduler.generate_schedule()
-        scheduler._save_json(schedule_result, schedule_file)
         
         # Step 2: AI Post-Analysis (skip if rate limit to avoid long waits)
+        # Runs on a worker thread while schedule.json is written
+        post_future = executor.submit(lambda: get_analyzer().analyze_schedule(schedule_result))
+        scheduler._save_json(schedule_result, schedule_file)
+        
         ai_analysis = None
         try:
-            analyzer = AIAnalyzer()
-            ai_analysis = analyzer.analyze_schedule(schedule_result)
+            ai_analysis = post_future.result(timeout=AI_TIMEOUT)
             
             # If all AI calls failed due to rate limit, set to None to avoid showing error messages
             if ai_analysis:
@@ -123,26 +218,38 @@ def generate_schedule():
                 'suggestions': ai_analysis.get('optimization_suggestions', '')
             }
         
-        # Save final result
+        # Save final result (compact + gzipped copy for /api/data)
         final_output_file = os.path.join(data_dir, 'schedule_with_ai.json')
-        scheduler._save_json(final_result, final_output_file)
+        _write_compact_json(final_output_file, final_result)
         
-        # Copy to frontend public folder
-        import shutil
-        frontend_public = os.path.join(base_dir, '..', 'frontend', 'public')
-        os.makedirs(frontend_public, exist_ok=True)
-        shutil.copy2(final_output_file, os.path.join(frontend_public, 'schedule_with_ai.json'))
+        # Publish to frontend public folder
+        _publish_to_frontend('schedule_with_ai.json')
         
-        # Also copy data files to frontend public
+        # Also publish data files to frontend public
         for data_file in ['employees.json', 'locations.json', 'shifts.json']:
-            src_file = os.path.join(data_dir, data_file)
-            if os.path.exists(src_file):
-                shutil.copy2(src_file, os.path.join(frontend_public, data_file))
+            if os.path.exists(os.path.join(data_dir, data_file)):
+                _publish_to_frontend(data_file)
+        
+        return schedule_result['statistics']
+
+
+@app.route('/api/generate', methods=['POST'])
+def generate_schedule():
+    """Generate schedule with optional data updates"""
+    try:
+        # Get data from request (optional - if not provided, use files)
+        try:
+            request_data = request.get_json() or {}
+        except Exception as e:
+            # Handle empty or invalid JSON body gracefully
+            request_data = {}
+        
+        statistics = _run_generation(request_data)
         
         return jsonify({
             'success': True,
             'message': 'Schedule generated successfully',
-            'statistics': schedule_result['statistics']
+            'statistics': statistics
         })
         
     except Exception as e:
@@ -153,6 +260,35 @@ def generate_schedule():
             'error': str(e)
         }), 500
 
+@app.route('/api/generate/async', methods=['POST'])
+def generate_schedule_async():
+    """Start schedule generation in the background and return a job id to poll"""
+    try:
+        request_data = request.get_json() or {}
+    except Exception:
+        request_data = {}
+    
+    job_id = uuid.uuid4().hex
+    with jobs_lock:
+        _expire_jobs()
+        jobs[job_id] = {'status': 'running'}
+    job_executor.submit(_run_job, job_id, request_data)
+    
+    return jsonify({'success': True, 'job_id': job_id}), 202
+
+@app.route('/api/generate/status/<job_id>', methods=['GET'])
+def generate_status(job_id):
+    """Poll background generation job"""
+    with jobs_lock:
+        job = jobs.get(job_id)
+        # A finished job is reported once, then forgotten
+        if job is not None and job['status'] != 'running':
+            del jobs[job_id]
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    job = {k: v for k, v in job.items() if k != 'finished_at'}
+    return jsonify({'job_id': job_id, **job})
+
 @app.route('/api/save-data', methods=['POST'])
 def save_data():
     """Save data files (employees, locations, shifts)"""
@@ -164,49 +300,36 @@ def save_data():
         shifts_data = request_data.get('shifts')
         
         saved_files = []
+        unchanged_files = []
         
         # Save employees
         if employees_data:
-            emp_file = os.path.join(data_dir, 'employees.json')
-            with open(emp_file, 'w', encoding='utf-8') as f:
-                json.dump(employees_data, f, ensure_ascii=False, indent=2)
-            saved_files.append('employees.json')
-            
-            # Also copy to frontend public
-            frontend_public = os.path.join(base_dir, '..', 'frontend', 'public')
-            os.makedirs(frontend_public, exist_ok=True)
-            import shutil
-            shutil.copy2(emp_file, os.path.join(frontend_public, 'employees.json'))
+            # Writes atomically and publishes to frontend public; skipped if unchanged
+            if _save_data_file('employees.json', employees_data):
+                saved_files.append('employees.json')
+            else:
+                unchanged_files.append('employees.json')
         
         # Save locations
         if locations_data:
-            loc_file = os.path.join(data_dir, 'locations.json')
-            with open(loc_file, 'w', encoding='utf-8') as f:
-                json.dump(locations_data, f, ensure_ascii=False, indent=2)
-            saved_files.append('locations.json')
-            
-            # Also copy to frontend public
-            frontend_public = os.path.join(base_dir, '..', 'frontend', 'public')
-            os.makedirs(frontend_public, exist_ok=True)
-            import shutil
-            shutil.copy2(loc_file, os.path.join(frontend_public, 'locations.json'))
+            # Writes atomically and publishes to frontend public; skipped if unchanged
+            if _save_data_file('locations.json', locations_data):
+                saved_files.append('locations.json')
+            else:
+                unchanged_files.append('locations.json')
         
         # Save shifts
         if shifts_data:
-            shift_file = os.path.join(data_dir, 'shifts.json')
-            with open(shift_file, 'w', encoding='utf-8') as f:
-                json.dump(shifts_data, f, ensure_ascii=False, indent=2)
-            saved_files.append('shifts.json')
-            
-            # Also copy to frontend public
-            frontend_public = os.path.join(base_dir, '..', 'frontend', 'public')
-            os.makedirs(frontend_public, exist_ok=True)
-            import shutil
-            shutil.copy2(shift_file, os.path.join(frontend_public, 'shifts.json'))
+            # Writes atomically and publishes to frontend public; skipped if unchanged
+            if _save_data_file('shifts.json', shifts_data):
+                saved_files.append('shifts.json')
+            else:
+                unchanged_files.append('shifts.json')
         
         return jsonify({
             'success': True,
-            'message': f'Data saved successfully: {", ".join(saved_files)}'
+            'message': f'Data saved successfully: {", ".join(saved_files)}',
+            'unchanged': unchanged_files
         })
         
     except Exception as e:
@@ -221,7 +344,25 @@ def save_data():
 def get_data(filename):
     """Serve data files"""
     try:
-        return send_from_directory(data_dir, filename)
+        # Serve pre-compressed copy when the client accepts it and it is up to date
+        gz_path = os.path.join(data_dir, filename + '.gz')
+        src_path = os.path.join(data_dir, filename)
+        # ETag from mtime - every write (os.replace) gives the file a new one
+        etag = f"{os.stat(src_path).st_mtime_ns:x}"
+        if (
+            'gzip' in request.headers.get('Accept-Encoding', '')
+            and os.path.exists(gz_path)
+            and os.path.getmtime(gz_path) >= os.path.getmtime(src_path)
+        ):
+            response = send_from_directory(data_dir, filename + '.gz', mimetype='application/json',
+                                           etag=etag + '-gz', conditional=True)
+            response.headers['Content-Encoding'] = 'gzip'
+            response.headers['Vary'] = 'Accept-Encoding'
+        else:
+            response = send_from_directory(data_dir, filename, etag=etag, conditional=True)
+        # Always revalidate (data changes on save); a matching If-None-Match returns an empty 304
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
     except:
         return jsonify({'error': 'File not found'}), 404
 
@@ -233,7 +374,15 @@ if __name__ == '__main__':
     print(f"📂 Data directory: {data_dir}")
     print("\nAvailable endpoints:")
     print("  POST /api/generate - Generate schedule")
+    print("  POST /api/generate/async - Start schedule generation in background")
+    print("  GET  /api/generate/status/<job_id> - Poll background generation")
     print("  POST /api/save-data - Save data files")
     print("  GET  /api/data/<filename> - Get data files")
     print("\n" + "=" * 70)
-    app.run(port=8000, debug=True)
+    try:
+        # Production WSGI server - handles data requests while a generation is running
+        from waitress import serve
+        serve(app, host='127.0.0.1', port=8000, threads=8)
+    except ImportError:
+        print("⚠ waitress not installed - falling back to Flask's threaded dev server")
+        app.run(port=8000, threaded=True)
@@ -4,14 +4,46 @@ Main entry point - Generate schedule and analyze with AI
 
 import sys
 import os
-import json
+import concurrent.futures
+import orjson
 
 # Add current directory to path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from scheduler import ShiftScheduler
-from ai_analyzer import AIAnalyzer
-from ai_pre_analyzer import AIPreAnalyzer
+from ai_analyzer import get_analyzer
+from ai_pre_analyzer import get_pre_analyzer
+
+
+# Max seconds to wait for an AI step before continuing without it
+AI_TIMEOUT = 120
+
+# Worker threads for AI calls (network-bound) overlapping solver/file work
+executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+
+
+def _load_json(filepath: str):
+    """Load JSON data file"""
+    with open(filepath, 'rb') as f:
+        return orjson.loads(f.read())
+
+
+def _run_pre_analysis(employees_data: list, locations_data: list, shifts_data: list):
+    """Run AI pre-analysis on the loaded data, returning None if unavailable"""
+    try:
+        pre_analyzer = get_pre_analyzer()
+        ai_pre_analysis = pre_analyzer.analyze_scheduling_requirements(
+            employees_data, locations_data, shifts_data
+        )
+        print("✓ AI Pre-Analysis completed")
+        
+        # Optionally adjust scheduler parameters based on AI recommendations
+        if ai_pre_analysis.get('warnings'):
+            print("⚠ Warnings:", ", ".join(ai_pre_analysis['warnings']))
+        return ai_pre_analysis
+    except Exception as e:
+        print(f"⚠ AI Pre-Analysis skipped: {e}")
+        return None
 
 
 def main():
@@ -29,32 +61,24 @@ def main():
     schedule_file = os.path.join(base_dir, 'data', 'schedule.json')
     
     try:
+        # AI calls are network-bound while the solver is CPU-bound - run them on worker threads
         # Step 0: AI Pre-Analysis (optional but recommended)
         print("\n[STEP 0/3] AI Pre-Analysis - Analyzing requirements...")
-        try:
-            pre_analyzer = AIPreAnalyzer()
-            with open(employees_file, 'r', encoding='utf-8') as f:
-                employees_data = json.load(f)
-            with open(locations_file, 'r', encoding='utf-8') as f:
-                locations_data = json.load(f)
-            with open(shifts_file, 'r', encoding='utf-8') as f:
-                shifts_data = json.load(f)
-            
-            ai_pre_analysis = pre_analyzer.analyze_scheduling_requirements(
-                employees_data, locations_data, shifts_data
-            )
-            print("✓ AI Pre-Analysis completed")
-            
-            # Optionally adjust scheduler parameters based on AI recommendations
-            if ai_pre_analysis.get('warnings'):
-                print("⚠ Warnings:", ", ".join(ai_pre_analysis['warnings']))
-        except Exception as e:
-            print(f"⚠ AI Pre-Analysis skipped: {e}")
-            ai_pre_analysis = None
+        # Read each data file once and share it between pre-analysis and the scheduler
+        employees_data = _load_json(employees_file)
+        locations_data = _load_json(locations_file)
+        shifts_data = _load_json(shifts_file)
+        pre_future = executor.submit(_run_pre_analysis, employees_data, locations_data, shifts_data)
         
         # Step 1: Generate Schedule
         print("\n[STEP 1/3] Generating optimized schedule with OR-Tools...")
-        scheduler = ShiftScheduler(employees_file, locations_file, shifts_file)
+        scheduler = ShiftScheduler(employees_data, locations_data, shifts_data)
+        
+        try:
+            ai_pre_analysis = pre_future.result(timeout=AI_TIMEOUT)
+        except concurrent.futures.TimeoutError:
+            print("⚠ AI Pre-Analysis skipped: timed out")
+            ai_pre_analysis = None
         
         # Optionally use AI recommendations for constraints
         if ai_pre_analysis and ai_pre_analysis.get('suggested_constraints'):
@@ -64,19 +88,24 @@ def main():
                 scheduler.min_employees_per_shift = constraints['min_employees_per_shift']
         
         schedule_result = scheduler.generate_schedule()
-        scheduler._save_json(schedule_result, schedule_file)
         
+        # Step 2: Analyze with AI while the schedule is written to disk
+        print("\n[STEP 2/3] AI Post-Analysis - Analyzing generated schedule...")
+        post_future = executor.submit(lambda: get_analyzer().analyze_schedule(schedule_result))
+        
+        scheduler._save_json(schedule_result, schedule_file)
         print(f"\n✓ Schedule generated: {schedule_result['statistics']['total_assignments']} assignments")
         
-        # Step 2: Analyze with AI
-        print("\n[STEP 2/3] AI Post-Analysis - Analyzing generated schedule...")
         try:
-            analyzer = AIAnalyzer()
-            ai_analysis = analyzer.analyze_schedule(schedule_result)
+            ai_analysis = post_future.result(timeout=AI_TIMEOUT)
         except ValueError as e:
             print(f"\n⚠ Warning: {e}")
             print("⚠ Continuing without AI analysis...")
             ai_analysis = None
+        except concurrent.futures.TimeoutError:
+            print("\n⚠ Warning: AI analysis timed out")
+            print("⚠ Continuing without AI analysis...")
+            ai_analysis = None
         
         # Combine results
         final_result = {
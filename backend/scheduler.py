@@ -3,20 +3,39 @@ HRM Scheduling System - Main Scheduler using OR-Tools
 Solves the shift assignment problem with constraint programming
 """
 
-import json
 import math
 from datetime import datetime, timedelta
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Union
+import numpy as np
+import orjson
 from ortools.sat.python import cp_model
 import os
 
 
+def _count_in_order(values: List) -> Tuple[List, np.ndarray, np.ndarray]:
+    """Count occurrences of each value; returns keys in first-appearance order, counts, per-value key index"""
+    if not values:
+        return [], np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    keys, first_index, inverse, counts = np.unique(
+        np.asarray(values), return_index=True, return_inverse=True, return_counts=True
+    )
+    order = np.argsort(first_index)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return keys[order].tolist(), counts[order], rank[inverse.ravel()]
+
+
 class ShiftScheduler:
-    def __init__(self, employees_file: str, locations_file: str, shifts_file: str):
-        """Initialize scheduler with data files"""
-        self.employees = self._load_json(employees_file)
-        self.locations = self._load_json(locations_file)
-        self.shifts = self._load_json(shifts_file)
+    def __init__(
+        self,
+        employees: Union[str, List[Dict]],
+        locations: Union[str, List[Dict]],
+        shifts: Union[str, List[Dict]]
+    ):
+        """Initialize scheduler with data file paths or already-loaded data lists"""
+        self.employees = self._load_json(employees) if isinstance(employees, str) else employees
+        self.locations = self._load_json(locations) if isinstance(locations, str) else locations
+        self.shifts = self._load_json(shifts) if isinstance(shifts, str) else shifts
         
         # Constants
         self.num_days = 14  # 2 weeks
@@ -28,6 +47,7 @@ class ShiftScheduler:
         self.num_employees = len(self.employees)
         self.num_locations = len(self.locations)
         self.num_shifts_per_day = len(self.shifts)
+        self.location_capacities = [loc.get('capacity', 20) for loc in self.locations]
         
         # Create date range (14 days starting from today)
         start_date = datetime.now().date()
@@ -35,20 +55,55 @@ class ShiftScheduler:
     
     def _load_json(self, filepath: str) -> List[Dict]:
         """Load JSON data from file"""
-        with open(filepath, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        with open(filepath, 'rb') as f:
+            return orjson.loads(f.read())
     
     def _save_json(self, data: Dict, filepath: str):
         """Save data to JSON file"""
         os.makedirs(os.path.dirname(filepath), exist_ok=True)
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2, default=str)
+        option = orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        with open(filepath, 'wb') as f:
+            f.write(orjson.dumps(data, option=option, default=str))
+    
+    def _build_skill_mask(self) -> List[List[bool]]:
+        """allowed[e][l] = employee e has at least one skill required at location l"""
+        required_sets = [frozenset(loc.get('required_skills', [])) for loc in self.locations]
+        return [
+            [not required.isdisjoint(emp.get('skills', [])) for required in required_sets]
+            for emp in self.employees
+        ]
     
-    def _employee_has_required_skills(self, employee: Dict, location: Dict) -> bool:
-        """Check if employee has required skills for location"""
-        employee_skills = set(employee.get('skills', []))
-        required_skills = set(location.get('required_skills', []))
-        return bool(employee_skills.intersection(required_skills))
+    def _greedy_hint(self, mask: np.ndarray) -> np.ndarray:
+        """Least-loaded-first assignment used to warm-start the solver (may not be feasible)"""
+        hint = np.zeros(mask.shape, dtype=bool)
+        # Even share of the weekly workload per slot (at least the staffing minimum)
+        slots_per_week = 7 * self.num_locations * self.num_shifts_per_day
+        fair_share = max(
+            self.min_employees_per_shift,
+            -(-self.num_employees * self.max_shifts_per_employee_per_week // slots_per_week)
+        )
+        slot_limits = [min(fair_share, capacity) for capacity in self.location_capacities]
+        week_counts = np.zeros(self.num_employees, dtype=np.int64)
+        for d in range(self.num_days):
+            if d % 7 == 0:
+                week_counts[:] = 0
+            # Spread the weekly maximum evenly over the week so late days are still staffed
+            budget = -(-self.max_shifts_per_employee_per_week * (d % 7 + 1) // 7)
+            working = np.zeros((self.num_employees, self.num_shifts_per_day), dtype=bool)
+            for s in range(self.num_shifts_per_day):
+                # Skip employees over budget or on the previous (consecutive) shift
+                free = week_counts < budget
+                if s > 0:
+                    free &= ~working[:, s - 1]
+                for l in range(self.num_locations):
+                    candidates = np.flatnonzero(mask[:, d, l, s] & free)
+                    chosen = candidates[np.argsort(week_counts[candidates], kind='stable')]
+                    chosen = chosen[:slot_limits[l]]
+                    hint[chosen, d, l, s] = True
+                    working[chosen, s] = True
+                    free[chosen] = False
+                    week_counts[chosen] += 1
+        return hint
     
     def generate_schedule(self) -> Dict:
         """Generate optimal schedule using OR-Tools CP-SAT"""
@@ -56,115 +111,117 @@ class ShiftScheduler:
         # Create the model
         model = cp_model.CpModel()
         
-        # Decision variables: shifts[(employee, day, location, shift)]
-        # = 1 if employee works this shift at this location on this day
-        shifts = {}
-        for e in range(self.num_employees):
+        # Skill eligibility per (employee, location), computed once
+        allowed = self._build_skill_mask()
+        # Employees with no eligible location get no variables; skip them in every loop
+        viable_employees = [e for e in range(self.num_employees) if any(allowed[e])]
+        if not viable_employees:
+            raise ValueError("No employee has the skills required by any location")
+        
+        # Decision variables: shifts[employee, day, location, shift]
+        # = 1 if employee works this shift at this location on this day.
+        # Dense object array + boolean mask of which variables exist (no tuple hashing)
+        dims = (self.num_employees, self.num_days, self.num_locations, self.num_shifts_per_day)
+        shifts = np.empty(dims, dtype=object)
+        mask = np.zeros(dims, dtype=bool)
+        # Position of each variable in the solver's solution vector
+        var_index = np.zeros(dims, dtype=np.int64)
+        for e in viable_employees:
             for d in range(self.num_days):
                 for l in range(self.num_locations):
+                    # Only create variables if employee has required skills
+                    if not allowed[e][l]:
+                        continue
                     for s in range(self.num_shifts_per_day):
-                        # Only create variable if employee has required skills
-                        if self._employee_has_required_skills(self.employees[e], self.locations[l]):
-                            shifts[(e, d, l, s)] = model.NewBoolVar(
-                                f'employee_{e}_day_{d}_location_{l}_shift_{s}'
-                            )
+                        var = model.NewBoolVar(f'employee_{e}_day_{d}_location_{l}_shift_{s}')
+                        shifts[e, d, l, s] = var
+                        var_index[e, d, l, s] = var.Index()
+                    mask[e, d, l, :] = True
         
-        # CONSTRAINT 1: Each shift at each location must have minimum employees
+        # CONSTRAINTS 1 & 2: Each shift at each location needs at least the minimum
+        # number of employees and cannot exceed capacity (one bounded linear constraint)
         for d in range(self.num_days):
-            for l in range(self.num_locations):
+            for l, capacity in enumerate(self.location_capacities):
                 for s in range(self.num_shifts_per_day):
-                    employees_for_shift = [
-                        shifts[(e, d, l, s)]
-                        for e in range(self.num_employees)
-                        if (e, d, l, s) in shifts
-                    ]
+                    employees_for_shift = shifts[mask[:, d, l, s], d, l, s].tolist()
                     if employees_for_shift:
-                        model.Add(sum(employees_for_shift) >= self.min_employees_per_shift)
-        
-        # CONSTRAINT 2: Each shift at each location cannot exceed capacity
-        for d in range(self.num_days):
-            for l in range(self.num_locations):
-                for s in range(self.num_shifts_per_day):
-                    employees_for_shift = [
-                        shifts[(e, d, l, s)]
-                        for e in range(self.num_employees)
-                        if (e, d, l, s) in shifts
-                    ]
-                    capacity = self.locations[l].get('capacity', 20)
-                    if employees_for_shift:
-                        model.Add(sum(employees_for_shift) <= capacity)
+                        model.AddLinearConstraint(
+                            cp_model.LinearExpr.Sum(employees_for_shift), self.min_employees_per_shift, capacity
+                        )
         
         # CONSTRAINT 3: Employee cannot work multiple shifts at the same time
-        for e in range(self.num_employees):
+        for e in viable_employees:
             for d in range(self.num_days):
                 for s in range(self.num_shifts_per_day):
-                    shifts_for_time = [
-                        shifts[(e, d, l, s)]
-                        for l in range(self.num_locations)
-                        if (e, d, l, s) in shifts
-                    ]
-                    if shifts_for_time:
-                        model.Add(sum(shifts_for_time) <= 1)
+                    shifts_for_time = shifts[e, d, mask[e, d, :, s], s].tolist()
+                    if len(shifts_for_time) > 1:
+                        model.AddAtMostOne(shifts_for_time)
         
         # CONSTRAINT 4: Employee cannot work consecutive shifts on the same day
-        # (e.g., morning + afternoon, or afternoon + evening)
-        for e in range(self.num_employees):
+        # (e.g., morning + afternoon, or afternoon + evening) at any pair of locations
+        for e in viable_employees:
             for d in range(self.num_days):
-                # Cannot work shift 0 and 1 (morning + afternoon)
-                if (e, d, 0, 0) in shifts and (e, d, 0, 1) in shifts:
-                    for l1 in range(self.num_locations):
-                        for l2 in range(self.num_locations):
-                            if (e, d, l1, 0) in shifts and (e, d, l2, 1) in shifts:
-                                model.Add(shifts[(e, d, l1, 0)] + shifts[(e, d, l2, 1)] <= 1)
-                # Cannot work shift 1 and 2 (afternoon + evening)
-                if (e, d, 0, 1) in shifts and (e, d, 0, 2) in shifts:
-                    for l1 in range(self.num_locations):
-                        for l2 in range(self.num_locations):
-                            if (e, d, l1, 1) in shifts and (e, d, l2, 2) in shifts:
-                                model.Add(shifts[(e, d, l1, 1)] + shifts[(e, d, l2, 2)] <= 1)
+                for s in range(self.num_shifts_per_day - 1):
+                    consecutive = shifts[e, d, :, s:s + 2][mask[e, d, :, s:s + 2]].tolist()
+                    # At most one of shift s / s+1 across all locations
+                    if len(consecutive) > 1:
+                        model.AddAtMostOne(consecutive)
         
         # CONSTRAINT 5: Min/Max shifts per employee per week
-        for e in range(self.num_employees):
-            for week in range(2):  # 2 weeks
-                week_days = range(week * 7, min((week + 1) * 7, self.num_days))
-                total_shifts = [
-                    shifts[(e, d, l, s)]
-                    for d in week_days
-                    for l in range(self.num_locations)
-                    for s in range(self.num_shifts_per_day)
-                    if (e, d, l, s) in shifts
-                ]
+        num_weeks = (self.num_days + 6) // 7
+        weekly_totals = [[] for _ in range(num_weeks)]
+        for e in viable_employees:
+            for week in range(num_weeks):
+                week_days = slice(week * 7, min((week + 1) * 7, self.num_days))
+                total_shifts = shifts[e, week_days][mask[e, week_days]].tolist()
                 if total_shifts:
-                    model.Add(sum(total_shifts) >= self.min_shifts_per_employee_per_week)
-                    model.Add(sum(total_shifts) <= self.max_shifts_per_employee_per_week)
+                    week_total = cp_model.LinearExpr.Sum(total_shifts)
+                    model.AddLinearConstraint(
+                        week_total,
+                        self.min_shifts_per_employee_per_week,
+                        self.max_shifts_per_employee_per_week
+                    )
+                    weekly_totals[week].append(week_total)
         
         # CONSTRAINT 6: Balance shifts across employees (fairness)
-        # Maximize minimum shifts per employee, minimize maximum shifts
-        employee_total_shifts = []
-        for e in range(self.num_employees):
-            total = [
-                shifts[(e, d, l, s)]
-                for d in range(self.num_days)
-                for l in range(self.num_locations)
-                for s in range(self.num_shifts_per_day)
-                if (e, d, l, s) in shifts
-            ]
-            if total:
-                employee_total_shifts.append(sum(total))
-        
-        # Objective: Maximize the minimum number of shifts (fairness)
-        if employee_total_shifts:
-            min_shifts = model.NewIntVar(0, self.num_days * self.num_shifts_per_day * self.num_locations, 'min_shifts')
-            model.AddMinEquality(min_shifts, employee_total_shifts)
-            model.Maximize(min_shifts)
+        # Every constraint above stays within one week, so fairness is measured per week
+        # too: the weeks are then independent subproblems linked only by a separable sum.
+        # Objective: Maximize the sum of each week's minimum shifts per employee
+        week_minimums = []
+        for week, totals in enumerate(weekly_totals):
+            if totals:
+                week_len = min((week + 1) * 7, self.num_days) - week * 7
+                # Loose domain on purpose: presolve tightens it from the weekly min/max
+                # constraints, and hard-coding [min_per_week, max_per_week] slowed solves
+                min_shifts = model.NewIntVar(
+                    0, week_len * self.num_shifts_per_day * self.num_locations, f'min_shifts_week_{week}'
+                )
+                model.AddMinEquality(min_shifts, totals)
+                week_minimums.append(min_shifts)
+        if week_minimums:
+            model.Maximize(sum(week_minimums))
+        
+        # No explicit symmetry breaking between interchangeable employees: ordering their
+        # totals (sum_e >= sum_e+1) measurably slowed solves on this model, and CP-SAT's
+        # presolve already detects the employee permutation symmetry on its own.
+        
+        # Warm start: hint every variable with a greedy assignment (hints are not constraints)
+        hint = self._greedy_hint(mask)
+        # Written straight into the model proto: one bulk extend instead of an AddHint call per variable
+        solution_hint = model.Proto().solution_hint
+        solution_hint.vars.extend(var_index[mask].tolist())
+        solution_hint.values.extend(hint[mask].astype(np.int64).tolist())
         
         # Solve
         solver = cp_model.CpSolver()
         solver.parameters.max_time_in_seconds = 60.0  # 60 second timeout
+        # Portfolio search: workers run different strategies in parallel
+        solver.parameters.num_workers = os.cpu_count() or 8
+        solver.parameters.log_search_progress = False
         status = solver.Solve(model)
         
         if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
-            schedule = self._extract_schedule(shifts, solver)
+            schedule = self._extract_schedule(var_index, mask, solver)
             statistics = self._calculate_statistics(schedule)
             
             result = {
@@ -183,74 +240,65 @@ class ShiftScheduler:
         else:
             raise Exception(f"Solver failed with status: {status}")
     
-    def _extract_schedule(self, shifts: Dict, solver: cp_model.CpSolver) -> List[Dict]:
+    def _extract_schedule(self, var_index: np.ndarray, mask: np.ndarray, solver: cp_model.CpSolver) -> List[Dict]:
         """Extract schedule from solved model"""
         assignments = []
         
-        for e in range(self.num_employees):
-            for d in range(self.num_days):
-                for l in range(self.num_locations):
-                    for s in range(self.num_shifts_per_day):
-                        if (e, d, l, s) in shifts and solver.Value(shifts[(e, d, l, s)]) == 1:
-                            assignments.append({
-                                'employee_id': self.employees[e]['id'],
-                                'employee_name': self.employees[e]['name'],
-                                'date': str(self.dates[d]),
-                                'location_id': self.locations[l]['id'],
-                                'location_name': self.locations[l]['name'],
-                                'shift_id': self.shifts[s]['id'],
-                                'shift_name': self.shifts[s]['name'],
-                                'start_time': self.shifts[s]['start_time'],
-                                'end_time': self.shifts[s]['end_time']
-                            })
+        # Flatten the string fields once so the loop only indexes tuples
+        emp_rows = [(emp['id'], emp['name']) for emp in self.employees]
+        loc_rows = [(loc['id'], loc['name']) for loc in self.locations]
+        shift_rows = [(sh['id'], sh['name'], sh['start_time'], sh['end_time']) for sh in self.shifts]
+        date_strs = [str(date) for date in self.dates]
+        
+        # Read the whole solution vector once instead of one solver.Value() call per variable
+        solution = np.asarray(solver.ResponseProto().solution, dtype=np.int64)
+        assigned = np.zeros(mask.shape, dtype=bool)
+        assigned[mask] = solution[var_index[mask]] == 1
+        
+        # np.nonzero walks in (e, d, l, s) order, same as nested loops
+        for e, d, l, s in zip(*(idx.tolist() for idx in np.nonzero(assigned))):
+            emp_id, emp_name = emp_rows[e]
+            loc_id, loc_name = loc_rows[l]
+            shift_id, shift_name, start_time, end_time = shift_rows[s]
+            assignments.append({
+                'employee_id': emp_id,
+                'employee_name': emp_name,
+                'date': date_strs[d],
+                'location_id': loc_id,
+                'location_name': loc_name,
+                'shift_id': shift_id,
+                'shift_name': shift_name,
+                'start_time': start_time,
+                'end_time': end_time
+            })
         
         return assignments
     
     def _calculate_statistics(self, schedule: List[Dict]) -> Dict:
         """Calculate statistics about the generated schedule including optimization metrics"""
-        # Count shifts per employee
-        employee_shifts = {}
-        employee_locations = {}  # Track which locations each employee works at
-        employee_shift_types = {}  # Track shift type distribution per employee
-        
+        # Count shifts per employee / location / day / shift type (vectorized)
+        emp_keys, emp_counts, emp_codes = _count_in_order([a['employee_id'] for a in schedule])
+        loc_keys, loc_counts, _ = _count_in_order([a['location_id'] for a in schedule])
+        day_keys, day_counts, _ = _count_in_order([a['date'] for a in schedule])
+        shift_keys, shift_counts, shift_codes = _count_in_order([a['shift_id'] for a in schedule])
+        
+        employee_shifts = dict(zip(emp_keys, emp_counts.tolist()))
+        location_shifts = dict(zip(loc_keys, loc_counts.tolist()))
+        day_shifts = dict(zip(day_keys, day_counts.tolist()))
+        shift_type_counts = dict(zip(shift_keys, shift_counts.tolist()))
+        
+        # Track which locations each employee works at as a bitmask (bit i = i-th location)
+        loc_bits = {loc_id: 1 << i for i, loc_id in enumerate(loc_keys)}
+        employee_locations = {}
         for assignment in schedule:
             emp_id = assignment['employee_id']
-            loc_id = assignment['location_id']
-            shift_id = assignment['shift_id']
-            
-            employee_shifts[emp_id] = employee_shifts.get(emp_id, 0) + 1
-            
-            if emp_id not in employee_locations:
-                employee_locations[emp_id] = set()
-            employee_locations[emp_id].add(loc_id)
-            
-            if emp_id not in employee_shift_types:
-                employee_shift_types[emp_id] = {}
-            employee_shift_types[emp_id][shift_id] = employee_shift_types[emp_id].get(shift_id, 0) + 1
-        
-        # Count shifts per location
-        location_shifts = {}
-        for assignment in schedule:
-            loc_id = assignment['location_id']
-            location_shifts[loc_id] = location_shifts.get(loc_id, 0) + 1
-        
-        # Count shifts per day
-        day_shifts = {}
-        for assignment in schedule:
-            day = assignment['date']
-            day_shifts[day] = day_shifts.get(day, 0) + 1
-        
-        # Count shifts per shift type
-        shift_type_counts = {}
-        for assignment in schedule:
-            shift_id = assignment['shift_id']
-            shift_type_counts[shift_id] = shift_type_counts.get(shift_id, 0) + 1
+            employee_locations[emp_id] = employee_locations.get(emp_id, 0) | loc_bits[assignment['location_id']]
         
         # Load Balancing Metrics
-        shift_values = list(employee_shifts.values())
+        shift_values = emp_counts.tolist()
         if shift_values:
-            avg_shifts = sum(shift_values) / len(shift_values)
-            variance = sum((x - avg_shifts) ** 2 for x in shift_values) / len(shift_values)
+            avg_shifts = float(emp_counts.mean())
+            variance = float(emp_counts.var())
             std_dev = variance ** 0.5
             coefficient_of_variation = (std_dev / avg_shifts) if avg_shifts > 0 else 0
             # Lower CV = better load balance (0 = perfect balance)
@@ -261,8 +309,8 @@ class ShiftScheduler:
         
         # Location Diversity Metrics (how many employees work across multiple locations)
         location_diversity = {}
-        for emp_id, locations in employee_locations.items():
-            location_diversity[emp_id] = len(locations)
+        for emp_id, location_mask in employee_locations.items():
+            location_diversity[emp_id] = location_mask.bit_count()
         
         employees_multi_location = sum(1 for count in location_diversity.values() if count > 1)
         location_diversity_rate = (employees_multi_location / len(location_diversity)) * 100 if location_diversity else 0
@@ -270,17 +318,14 @@ class ShiftScheduler:
         
         # Shift Type Diversity (balance of morning/afternoon/evening per employee)
         shift_diversity_scores = []
-        import math
-        for emp_id, shift_dist in employee_shift_types.items():
-            total = sum(shift_dist.values())
-            if total > 0:
-                # Calculate entropy (higher = more diverse)
-                entropy = -sum((count/total) * math.log2(count/total) if count > 0 else 0 
-                              for count in shift_dist.values())
-                # Normalize to 0-100 (max entropy for 3 types = log2(3) ≈ 1.585)
-                max_entropy = math.log2(3)
-                diversity_score = (entropy / max_entropy) * 100 if max_entropy > 0 else 0
-                shift_diversity_scores.append(diversity_score)
+        if emp_keys:
+            # (employee x shift type) count matrix -> row-wise entropy (higher = more diverse)
+            type_counts = np.zeros((len(emp_keys), len(shift_keys)))
+            np.add.at(type_counts, (emp_codes, shift_codes), 1)
+            p = type_counts / type_counts.sum(axis=1, keepdims=True)
+            entropy = -(p * np.log2(np.where(p > 0, p, 1))).sum(axis=1)
+            # Normalize to 0-100 (max entropy for 3 types = log2(3) ≈ 1.585)
+            shift_diversity_scores = (entropy / math.log2(3) * 100).tolist()
         
         avg_shift_diversity = sum(shift_diversity_scores) / len(shift_diversity_scores) if shift_diversity_scores else 0
         